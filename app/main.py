@@ -17,10 +17,19 @@ import re
 from utils.download_video import download_video
 from utils.extract_audio import extract_audio
 from utils.transcribe_audio import transcribe_audio
-from utils.translate_text import translate_text
+from utils.translate_text import translate_text, translate_text_batch
 from utils.synthesize_audio import synthesize_audio, synthesize_audio_openai
 from utils.replace_original_audio import replace_original_audio
 from utils.AudioVideoTranslator import AudioVideoTranslator
+from utils.job_queue import JobQueue, QueueFullError
+from utils.model_registry import model_registry
+from utils.workspace import JobWorkspace
+from utils.artifact_store import hash_text
+from utils.translation_memory import translation_memory
+from utils.http_clients import close_clients
+from utils.translator_router import translator_router
+from utils.rate_limiter import rate_limiter
+from utils.tts_backends import tts_registry, TTS_BACKEND
 
 import logging
 logger = logging.getLogger(__name__)
@@ -41,6 +50,11 @@ download_folder = os.environ.get("DOWNLOAD_FOLDER", "./downloads")
 videos_dir = translations_folder = os.environ.get("TRANSLATIONS_FOLDER", "./translations")
 base_file_url = os.environ.get("VIDEO_BASE_URL", "localhost:8081/videos/")
 
+# Translation jobs run here, outside of the event loop
+job_queue = JobQueue()
+# Comma-separated model names to load at startup, e.g. "whisper,diarization"
+warmup_models = os.environ.get("WARMUP_MODELS", "")
+
 
 # Pass the pattern to executor like this : r"_(\d+)-(\d+)_(\d+)\.wav$"
 def execute_files(file_paths, execution_function, pattern, max_workers=2):
@@ -113,7 +127,54 @@ async def get_video(filename: str):
 def generate_video_urls(video_filenames):
     return [base_file_url + filename for filename in video_filenames]
 
-@app.post("/translate_video_url/")
+def run_translation_job(job, url, cleaned_languages, translators, speakers):
+    """
+    Full translation pipeline for one video, executed by a job_queue worker.
+    Returns the translated file name, the URL it is served from and the title in every requested language.
+    """
+    job.set_stage("downloading")
+    video_path = download_video(url, output_path=download_folder)
+    if video_path is None:
+        raise RuntimeError(f"Failed to download video: {url}")
+
+    job.set_stage("extracting_audio")
+    # Next to the video, in the folder download_video created for this URL
+    audio_path = extract_audio(video_path, output_path=os.path.dirname(video_path))
+    if audio_path is None:
+        raise RuntimeError(f"Failed to extract audio from: {video_path}")
+
+    # Segment files of this job stay in its own folder, so jobs can run in parallel.
+    # The folder is named after the request, so a retry of a failed job resumes from its manifest.
+    job_key = hash_text(json.dumps([url, cleaned_languages[0], speakers]))[:16]
+    workspace = JobWorkspace(job_key)
+    workspace.acquire()
+    try:
+        job.set_stage("loading_models")
+        av = AudioVideoTranslator(audio_path, video_path, output_folder=translations_folder, lang = cleaned_languages[0], translators=translators, speakers = speakers, workspace = workspace)
+        print("Input media:", audio_path, video_path)
+
+        job.set_stage("diarization_and_translation")
+        av._perform_audio_diarization()
+
+        job.set_stage("translating_title")
+        filename_no_extention = os.path.splitext(os.path.basename(video_path))[0]
+        # Translate the filename text to all requested languages at once
+        translated_titles = translate_text_batch(filename_no_extention, cleaned_languages, translators, prompt = "consider translation no longer then original text")
+        filename_no_extention_trans = translated_titles[cleaned_languages[0]]
+        if filename_no_extention_trans is None:
+            raise RuntimeError("Translation failed due to missing valid translators or API keys.")
+
+        job.set_stage("merging")
+        # Merge files and Rename the output file with the translated filename
+        translated_filename = av.merge_video_files(output_filename = f"{filename_no_extention_trans}.mp4")
+    finally:
+        # On failure the workspace and its manifest are kept for the retry
+        workspace.release()
+
+    job.set_stage("done")
+    return {"file": translated_filename, "url": generate_video_urls([translated_filename])[0], "titles": translated_titles}
+
+@app.post("/translate_video_url/", status_code=202)
 async def translate_video_url(url: str, target_languages: str, request: Request):
     logger.info(f"/translate_video_url/ endpoint ,url: {url} target_languages: {target_languages}")
     session,_ = get_session(request)
@@ -130,8 +191,6 @@ async def translate_video_url(url: str, target_languages: str, request: Request)
     logger.info(f"genders: {genders}")
     user_id = session.get("user_id", str(uuid.uuid4()))
 
-    translated_videos = []
-
     translators = {
         "OpenAI": {"name": "openai", "available": True, "function": "openai_translate_text", "api_key": openAIkey, "model_name": "davinci"},
         "Ollama": {"name": "ollama", "available": True, "function": "translate_text_with_ollama", "api_key": None, "model_name": "llama2"},
@@ -149,37 +208,56 @@ async def translate_video_url(url: str, target_languages: str, request: Request)
     if not cleaned_languages:
         raise HTTPException(status_code=400, detail="No meaningful target languages found.")
 
-    video_path = download_video(url, output_path=download_folder)
-    audio_path = extract_audio(video_path, output_path=download_folder)
-    av = AudioVideoTranslator(audio_path, video_path, output_folder=translations_folder, lang = cleaned_languages[0], translators=translators, speakers = speakers)   
-    print("Input media:", audio_path, video_path)
-    av._perform_audio_diarization()
-    filename_no_extention = os.path.splitext(os.path.basename(video_path))[0]
-        # Translate the filename text
-    filename_no_extention_trans = translate_text(filename_no_extention, cleaned_languages[0], translators, prompt = "consider translation no longer then original text")
-    if filename_no_extention_trans is None:
-         return {"message": "Translation failed due to missing valid translators or API keys."}
-    # Merge files and Rename the output file with the translated filename 
-    translated_video_path = av.merge_video_files(output_filename = f"{filename_no_extention_trans}.mp4")
-    
-    """
-    for lang in cleaned_languages:
-      for filename,transcription in results.items():
-        translated_text = translate_text(transcription, lang, translators, prompt = None, audio_path = f"{filename}.txt")
-        translated_audio_path = synthesize_audio_openai(translated_text, lang, translations="translations",api_key=None , simulate_male_voice=True, speaker=0)
-       
-        translated_video_path = replace_original_audio(video_path, translated_audio_path)
-        translated_videos.append(translated_video_path)
+    try:
+        job = job_queue.submit(run_translation_job, url, cleaned_languages, translators, speakers)
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
 
-    #shutil.rmtree(translations_folder, ignore_errors=True)
-    #os.makedirs(translations_folder, exist_ok=True)
-    """
-        # Return both file and message
     return {
-        "message": "Translation completed successfully! To get the translated video, click the link below (temporary not accessable send eMail to zeroprg@gmail.com).",
-        "file": FileResponse(translated_video_path, media_type='application/octet-stream')
+        "message": "Translation job accepted. Poll the status URL until the job is completed.",
+        "job_id": job.id,
+        "status_url": f"/jobs/{job.id}",
     }
-    return {"message": "Translation completed successfully.", "translated_videos": generate_video_urls([ f"{filename_no_extention_trans}.mp4", f"{filename_no_extention}.txt"])}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+@app.get("/models")
+async def get_models():
+    return model_registry.stats()
+
+@app.get("/translation_memory")
+async def get_translation_memory():
+    return translation_memory.stats()
+
+@app.get("/translators")
+async def get_translators():
+    return translator_router.stats()
+
+@app.get("/rate_limits")
+async def get_rate_limits():
+    return rate_limiter.stats()
+
+@app.get("/tts_backends")
+async def get_tts_backends():
+    return {"selected": TTS_BACKEND, "backends": tts_registry.describe()}
+
+@app.on_event("startup")
+def warm_up_models():
+    names = [name.strip() for name in warmup_models.split(",") if name.strip()]
+    if names:
+        logger.info(f"Warming up models: {names}")
+        model_registry.warm_up(names)
+
+@app.on_event("shutdown")
+def shutdown_job_queue():
+    job_queue.shutdown(wait=False)
+    close_clients()
+    tts_registry.shutdown()
 
 @app.post("/translate_video_file/")
 async def translate_video_file(file: UploadFile, target_languages: str, request: Request):
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The tests import the modules the way main.py does, e.g. "from utils.rate_limiter import ..."
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
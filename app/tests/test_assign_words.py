@@ -0,0 +1,52 @@
+import pytest
+
+from utils.AudioVideoTranslator import assign_words_to_segments
+
+
+def word(start, end, text):
+    # Whisper words carry their leading space
+    return {"start": start, "end": end, "word": f" {text}"}
+
+
+SEGMENTS = [(0.0, 2.0), (2.0, 4.0), (6.0, 8.0)]
+
+
+def test_words_inside_segments():
+    words = [word(0.1, 0.5, "one"), word(0.6, 1.0, "two"), word(2.5, 3.0, "three"), word(6.5, 7.0, "four")]
+    assert assign_words_to_segments(words, SEGMENTS) == ["one two", "three", "four"]
+
+
+def test_word_ending_or_starting_on_a_boundary():
+    words = [word(1.5, 2.0, "end"), word(2.0, 2.4, "start")]
+    assert assign_words_to_segments(words, SEGMENTS) == ["end", "start", None]
+
+
+@pytest.mark.parametrize("start, end, expected", [
+    (1.9, 2.5, 1),  # mostly in the second segment
+    (1.2, 2.1, 0),  # mostly in the first segment
+    (1.5, 2.5, 0),  # a tie goes to the earlier segment
+])
+def test_word_across_a_boundary_goes_to_the_largest_overlap(start, end, expected):
+    texts = assign_words_to_segments([word(start, end, "word")], SEGMENTS)
+    assert texts[expected] == "word"
+    assert sum(text is not None for text in texts) == 1
+
+
+@pytest.mark.parametrize("start, end, expected", [
+    (4.2, 4.6, 1),  # closer to the end of the second segment
+    (5.4, 5.8, 2),  # closer to the start of the third segment
+])
+def test_word_in_a_gap_goes_to_the_nearest_segment(start, end, expected):
+    texts = assign_words_to_segments([word(start, end, "gap")], SEGMENTS)
+    assert texts[expected] == "gap"
+
+
+def test_words_before_the_first_and_after_the_last_segment():
+    segments = [(1.0, 2.0), (3.0, 4.0)]
+    words = [word(0.0, 0.4, "early"), word(4.5, 5.0, "late")]
+    assert assign_words_to_segments(words, segments) == ["early", "late"]
+
+
+def test_no_segments_or_no_words():
+    assert assign_words_to_segments([word(0.0, 1.0, "lost")], []) == []
+    assert assign_words_to_segments([], SEGMENTS) == [None, None, None]
@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+from utils.replace_original_audio import speed_change_factor, fit_samples_to_duration
+
+RATE = 16000
+
+
+@pytest.mark.parametrize("audio_duration", [2.0, 2.9, 3.0, 3.05])
+def test_speech_that_fits_is_not_stretched(audio_duration):
+    assert speed_change_factor(audio_duration, 3.0, tolerance=0.1) is None
+
+
+def test_overrun_is_sped_up():
+    assert speed_change_factor(3.6, 3.0, tolerance=0.1) == pytest.approx(1.2)
+
+
+def test_overrun_too_long_to_adjust():
+    assert speed_change_factor(5.0, 3.0, tolerance=0.1) is None
+
+
+def test_short_samples_keep_their_length():
+    samples = np.ones(2 * RATE, dtype=np.float32)
+    fitted = fit_samples_to_duration(samples, 3.0, RATE)
+    assert len(fitted) == len(samples)
+    assert np.array_equal(fitted, samples)
+
+
+def test_long_samples_end_with_the_range():
+    t = np.arange(int(3.6 * RATE)) / RATE
+    samples = (0.5 * np.sin(2 * np.pi * 220 * t)).astype(np.float32)
+    assert len(fit_samples_to_duration(samples, 3.0, RATE)) == 3 * RATE
@@ -0,0 +1,108 @@
+import time
+
+import pytest
+
+from utils import rate_limiter as rate_limiter_module
+from utils.rate_limiter import RateLimiter, ProviderLimiter, TokenBucket, rate_limit_status, is_transient
+
+
+class FakeResponse():
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class HTTPError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"HTTP {status_code}")
+        self.response = FakeResponse(status_code, headers)
+
+
+class ReadTimeout(Exception):
+    pass
+
+
+def test_rate_limit_status_reads_retry_after():
+    assert rate_limit_status(HTTPError(429, {"retry-after": "1.5"})) == (True, 1.5)
+    assert rate_limit_status(HTTPError(429)) == (True, None)
+    assert rate_limit_status(HTTPError(500)) == (False, None)
+
+
+def test_transient_errors():
+    assert is_transient(HTTPError(503))
+    assert is_transient(ReadTimeout())
+    assert is_transient(ConnectionResetError())
+    assert not is_transient(HTTPError(400))
+    assert not is_transient(ValueError())
+
+
+def test_aimd_halves_on_429_and_grows_back():
+    limiter = ProviderLimiter("test", max_concurrency=8)
+    limiter.on_rate_limited(0)
+    assert int(limiter.limit) == 4
+    limiter.on_rate_limited(0)
+    assert int(limiter.limit) == 2
+    for _ in range(20):
+        limiter.on_success()
+    assert 2 < limiter.limit <= 8
+
+
+def test_retry_after_pauses_the_next_call(monkeypatch):
+    monkeypatch.setattr(rate_limiter_module, "DEFAULT_LIMITS", {"requests_per_minute": 0, "tokens_per_minute": 0, "max_concurrency": 4})
+    limiter = RateLimiter(limits={})
+    calls = []
+
+    def rate_limited_once():
+        calls.append(time.monotonic())
+        if len(calls) == 1:
+            raise HTTPError(429, {"Retry-After": "0.2"})
+        return "ok"
+
+    assert limiter.call("test", None, rate_limited_once) == "ok"
+    assert calls[1] - calls[0] >= 0.2
+    assert int(limiter.limiter("test").limit) == 2
+
+
+def test_transient_errors_are_retried_with_backoff(monkeypatch):
+    monkeypatch.setattr(rate_limiter_module, "TRANSIENT_BACKOFF", 0.01)
+    limiter = RateLimiter(limits={})
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) <= rate_limiter_module.TRANSIENT_RETRIES:
+            raise HTTPError(502)
+        return "ok"
+
+    assert limiter.call("test", None, flaky) == "ok"
+    assert len(calls) == rate_limiter_module.TRANSIENT_RETRIES + 1
+    # Not a rate limit, the concurrency is not lowered
+    assert int(limiter.limiter("test").limit) == limiter.limiter("test").max_concurrency
+
+
+def test_client_errors_are_not_retried():
+    limiter = RateLimiter(limits={})
+    calls = []
+
+    def bad_request():
+        calls.append(1)
+        raise HTTPError(400)
+
+    with pytest.raises(HTTPError):
+        limiter.call("test", None, bad_request)
+    assert len(calls) == 1
+
+
+def test_stream_holds_its_slot_until_read():
+    limiter = RateLimiter(limits={})
+    stream = limiter.stream("test", None, lambda: iter(["a", "b"]))
+    assert next(stream) == "a"
+    assert limiter.limiter("test").in_flight == 1
+    assert list(stream) == ["b"]
+    assert limiter.limiter("test").in_flight == 0
+
+
+def test_token_bucket_wait_time():
+    bucket = TokenBucket(60)
+    bucket.take(60)
+    assert 0.9 < bucket.wait_time(1) <= 1.0
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from utils.time_stretch import time_stretch, dominant_frequency
+
+FPS = 44100
+
+
+def tone(frequency, seconds, channels=None):
+    t = np.arange(int(seconds * FPS)) / FPS
+    samples = (0.5 * np.sin(2 * np.pi * frequency * t)).astype(np.float32)
+    return samples if channels is None else np.stack([samples] * channels, axis=1)
+
+
+def middle_second(samples):
+    middle = len(samples) // 2
+    return samples[middle - FPS // 2:middle + FPS // 2]
+
+
+@pytest.mark.parametrize("rate", [0.75, 1.0, 1.2, 1.5, 2.0])
+def test_output_length(rate):
+    samples = tone(220, 2.3)
+    assert len(time_stretch(samples, rate)) == round(len(samples) / rate)
+
+
+@pytest.mark.parametrize("length", [0, 1, 100, 2049])
+def test_output_length_of_short_inputs(length):
+    samples = np.zeros(length, dtype=np.float32)
+    assert len(time_stretch(samples, 1.3)) == round(length / 1.3)
+
+
+@pytest.mark.parametrize("rate", [0.8, 1.25, 1.6])
+def test_pitch_is_preserved(rate):
+    stretched = time_stretch(tone(440, 4), rate)
+    assert dominant_frequency(middle_second(stretched), FPS) == pytest.approx(440, abs=3)
+
+
+def test_stereo_keeps_channels_and_dtype():
+    samples = tone(330, 2, channels=2)
+    stretched = time_stretch(samples, 1.4)
+    assert stretched.shape == (round(len(samples) / 1.4), 2)
+    assert stretched.dtype == np.float32
+    assert np.allclose(stretched[:, 0], stretched[:, 1])
+
+
+def test_level_is_kept():
+    stretched = middle_second(time_stretch(tone(440, 4), 1.3))
+    assert np.sqrt(np.mean(stretched ** 2)) == pytest.approx(0.5 / np.sqrt(2), rel=0.1)
+
+
+def test_invalid_rate():
+    with pytest.raises(ValueError):
+        time_stretch(tone(220, 1), 0)
@@ -0,0 +1,80 @@
+import json
+
+import pytest
+
+from utils.tokenizer_limiter import count_tokens, count_model_tokens
+from utils.translate_text import pack_sentences, pack_segments, parse_segment_batch, parse_batch_translation
+
+
+def test_parse_segment_batch_exact_ids():
+    response = json.dumps({"0": " Hola. ", "1": "Adiós."})
+    assert parse_segment_batch(response, ["0", "1"]) == {"0": "Hola.", "1": "Adiós."}
+
+
+def test_parse_segment_batch_surrounding_text_and_key_whitespace():
+    response = 'Here is the translation:\n```json\n{" 3 ": "Uno", "4": "Dos"}\n```'
+    assert parse_segment_batch(response, ["3", "4"]) == {"3": "Uno", "4": "Dos"}
+
+
+@pytest.mark.parametrize("data", [
+    {"0": "Hola."},                                  # missing id
+    {"0": "Hola.", "1": "Adiós.", "2": "Extra."},    # extra id
+    {"0": "Hola.", "2": "Adiós."},                   # wrong id
+    {"0": "Hola.", "1": "  "},                       # empty translation
+    {"0": "Hola.", "1": ["Adiós."]},                 # not a string
+])
+def test_parse_segment_batch_rejects_mismatched_answers(data):
+    assert parse_segment_batch(json.dumps(data), ["0", "1"]) is None
+
+
+@pytest.mark.parametrize("response", [None, "", "Hola. Adiós.", "{not json}", '["Hola.", "Adiós."]'])
+def test_parse_segment_batch_rejects_non_objects(response):
+    assert parse_segment_batch(response, ["0", "1"]) is None
+
+
+def test_parse_batch_translation():
+    response = json.dumps({"ES": ["Hola.", " Adiós. "], "fr": ["Salut.", "Au revoir."]})
+    assert parse_batch_translation(response, ["es", "fr"], 2) == {"es": ["Hola.", "Adiós."], "fr": ["Salut.", "Au revoir."]}
+
+
+@pytest.mark.parametrize("data", [
+    {"es": ["Hola.", "Adiós."]},                           # missing language
+    {"es": ["Hola."], "fr": ["Salut.", "Au revoir."]},     # missing line
+    {"es": ["Hola.", "Adiós.", "Más."], "fr": ["Salut.", "Au revoir."]},  # extra line
+    {"es": ["Hola.", ""], "fr": ["Salut.", "Au revoir."]},  # empty line
+    {"es": "Hola. Adiós.", "fr": ["Salut.", "Au revoir."]},  # not a list
+])
+def test_parse_batch_translation_rejects_mismatched_answers(data):
+    assert parse_batch_translation(json.dumps(data), ["es", "fr"], 2) is None
+
+
+def test_pack_sentences_keeps_order_and_budget():
+    sentences = ["One two three.", "Four five.", "Six seven eight nine.", "Ten."]
+    groups = pack_sentences(enumerate(sentences), text_portions=5)
+    assert groups == [[0, 1], [2, 3]]
+    for group in groups:
+        assert sum(count_tokens(sentences[index]) for index in group) <= 5
+
+
+def test_pack_sentences_oversized_sentence_gets_its_own_portion():
+    sentences = ["Short.", "A sentence far longer than the whole portion budget.", "Short again."]
+    assert pack_sentences(enumerate(sentences), text_portions=3) == [[0], [1], [2]]
+
+
+def test_pack_sentences_empty():
+    assert pack_sentences(enumerate([])) == []
+
+
+def test_pack_segments_only_packs_the_given_indexes():
+    texts = ["Hello there.", "", "How are you doing today?", "Fine.", "Bye."]
+    budget = count_model_tokens(texts[0]) + count_model_tokens(texts[2]) + 12
+    batches = pack_segments([0, 2, 3, 4], texts, budget)
+    assert [index for batch in batches for index in batch] == [0, 2, 3, 4]
+    assert batches[0] == [0, 2]
+    for batch in batches:
+        assert len(batch) == 1 or sum(count_model_tokens(texts[index]) + 6 for index in batch) <= budget
+
+
+def test_pack_segments_oversized_text_gets_its_own_batch():
+    texts = ["Hi.", " ".join(["word"] * 100), "Hi."]
+    assert pack_segments([0, 1, 2], texts, budget=20) == [[0], [1], [2]]
@@ -0,0 +1,71 @@
+import pytest
+
+from utils import translate_text as translate_text_module
+from utils.translate_text import translate_sentences, join_translations
+
+
+class FakeMemory():
+    def __init__(self):
+        self.stored = {}
+
+    def lookup(self, sentences, target_language, provider, model=None, prompt=None):
+        return {sentence: self.stored[sentence] for sentence in sentences if sentence in self.stored}
+
+    def store(self, pairs, target_language, provider, model=None, prompt=None):
+        self.stored.update(pairs)
+
+
+class FakeRouter():
+    def call(self, provider, function, portion, target_language, api_key, prompt=None, hedge=None):
+        return function(portion, target_language, api_key, prompt)
+
+
+@pytest.fixture
+def memory(monkeypatch):
+    memory = FakeMemory()
+    monkeypatch.setattr(translate_text_module, "translation_memory", memory)
+    monkeypatch.setattr(translate_text_module, "translator_router", FakeRouter())
+    monkeypatch.setattr(translate_text_module, "PORTION_RETRY_DELAY", 0)
+    return memory
+
+
+def line_translator(portion, target_language, api_key, prompt=None):
+    return "\n".join(f"T({line})" for line in portion.splitlines())
+
+
+def merging_translator(portion, target_language, api_key, prompt=None):
+    # Like an LLM that ignores the one line per sentence instruction
+    return " ".join(f"T({line})" for line in portion.splitlines())
+
+
+def test_repeated_sentences_are_sent_once(memory):
+    portions = []
+
+    def translator(portion, target_language, api_key, prompt=None):
+        portions.append(portion)
+        return line_translator(portion, target_language, api_key, prompt)
+
+    sentences = ["Hello there.", "Thanks for watching.", "Hello there."]
+    translations = translate_sentences(sentences, [None] * 3, "Spanish", None, translator)
+    assert translations == ["T(Hello there.)", "T(Thanks for watching.)", "T(Hello there.)"]
+    assert portions == ["Hello there.\nThanks for watching."]
+    assert memory.stored == {"Hello there.": "T(Hello there.)", "Thanks for watching.": "T(Thanks for watching.)"}
+
+
+def test_merged_lines_are_not_duplicated_or_reordered(memory):
+    sentences = ["Hello there.", "Thanks for watching.", "Hello there."]
+    translations = translate_sentences(sentences, [None] * 3, "Spanish", None, merging_translator)
+    assert translations == ["T(Hello there.)", "T(Thanks for watching.)", "T(Hello there.)"]
+    assert join_translations(translations) == "T(Hello there.)\nT(Thanks for watching.)\nT(Hello there.)"
+
+
+def test_sentence_failing_on_its_own_is_left_for_the_next_translator(memory):
+    def translator(portion, target_language, api_key, prompt=None):
+        if portion == "Thanks for watching.":
+            return None
+        return merging_translator(portion, target_language, api_key, prompt)
+
+    sentences = ["Hello there.", "Thanks for watching.", "Hello there."]
+    translations = translate_sentences(sentences, [None] * 3, "Spanish", None, translator)
+    assert translations == ["T(Hello there.)", None, "T(Hello there.)"]
+    assert "Thanks for watching." not in memory.stored
@@ -0,0 +1,86 @@
+import threading
+import time
+
+import pytest
+
+from utils import translator_router as router_module
+from utils.translator_router import TranslatorRouter, CircuitOpenError
+
+
+def failing(portion, target_language, api_key, prompt):
+    raise RuntimeError("down")
+
+
+def translated(portion, target_language, api_key, prompt):
+    return f"{portion} ({target_language})"
+
+
+TRANSLATORS = {
+    "A": {"name": "a", "function": "a"},
+    "B": {"name": "b", "function": "b"},
+}
+
+
+def open_circuit(router, provider):
+    for _ in range(router_module.CIRCUIT_FAILURES):
+        with pytest.raises(RuntimeError):
+            router.call(provider, failing, "text", "French", None)
+
+
+def test_open_circuit_is_left_out_of_the_order():
+    router = TranslatorRouter(hedge=False)
+    open_circuit(router, "a")
+    assert [info["name"] for info in router.order(TRANSLATORS)] == ["b"]
+    with pytest.raises(CircuitOpenError):
+        router.call("a", translated, "text", "French", None)
+
+
+def test_all_open_circuits_are_still_tried():
+    router = TranslatorRouter(hedge=False)
+    open_circuit(router, "a")
+    open_circuit(router, "b")
+    assert {info["name"] for info in router.order(TRANSLATORS)} == {"a", "b"}
+    assert router.call("a", translated, "text", "French", None) == "text (French)"
+
+
+def test_half_open_circuit_lets_one_trial_through(monkeypatch):
+    router = TranslatorRouter(hedge=False)
+    router.stats_for("b")
+    open_circuit(router, "a")
+    monkeypatch.setattr(router_module, "CIRCUIT_OPEN_SECONDS", 0)
+    router.stats_for("a").open_until = time.time() - 1
+
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow(portion, target_language, api_key, prompt):
+        started.set()
+        release.wait(5)
+        return "trial"
+
+    trial = threading.Thread(target=router.call, args=("a", slow, "text", "French", None))
+    trial.start()
+    started.wait(5)
+    # A second caller during the trial is turned away
+    with pytest.raises(CircuitOpenError):
+        router.call("a", translated, "text", "French", None)
+    release.set()
+    trial.join(5)
+    assert router.stats_for("a").available
+    assert router.call("a", translated, "text", "French", None) == "text (French)"
+
+
+def test_slow_call_is_hedged_and_hedge_takes_a_slot():
+    router = TranslatorRouter(hedge=True)
+    for _ in range(router_module.ROUTER_MIN_SAMPLES):
+        router.call("a", translated, "text", "French", None)
+    slots = threading.BoundedSemaphore(1)
+
+    def slow_failure(portion, target_language, api_key, prompt):
+        time.sleep(0.2)
+        return None
+
+    result = router.call("a", slow_failure, "text", "French", None, hedge=("b", translated, None, slots))
+    assert result == "text (French)"
+    # The slot of the hedge provider is given back
+    assert slots.acquire(blocking=False)
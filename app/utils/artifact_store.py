@@ -0,0 +1,207 @@
+# artifact_store.py
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import threading
+
+import logging
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)  # Set log level if needed
+
+ARTIFACTS_FOLDER = os.environ.get("ARTIFACTS_FOLDER", "./artifacts")
+ARTIFACTS_MAX_BYTES = int(os.environ.get("ARTIFACTS_MAX_BYTES", 20 * 1024 ** 3))
+
+HASH_CHUNK = 1024 * 1024
+
+_file_hashes = {}
+_file_hashes_lock = threading.Lock()
+
+
+def hash_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def hash_text(text):
+    return hash_bytes(text.encode("utf-8"))
+
+
+def hash_array(array):
+    """Hash of the raw samples of a numpy array (views are hashed without copying)."""
+    digest = hashlib.sha256()
+    data = memoryview(array).cast("B") if array.flags["C_CONTIGUOUS"] else array.tobytes()
+    for start in range(0, len(data), HASH_CHUNK):
+        digest.update(data[start:start + HASH_CHUNK])
+    return digest.hexdigest()
+
+
+def hash_file(path):
+    """Hash of the file content, remembered as long as the file size and mtime don't change."""
+    stat = os.stat(path)
+    cache_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    with _file_hashes_lock:
+        if cache_key in _file_hashes:
+            return _file_hashes[cache_key]
+    digest = hashlib.sha256()
+    with open(path, "rb") as input_file:
+        while chunk := input_file.read(HASH_CHUNK):
+            digest.update(chunk)
+    with _file_hashes_lock:
+        _file_hashes[cache_key] = digest.hexdigest()
+    return _file_hashes[cache_key]
+
+
+class ArtifactStore():
+    """
+    Content addressed cache of pipeline artifacts.
+    Keys are a hash of the stage name, the hash of the stage input and the stage parameters,
+    so the same input processed with another model, language or voice gets a different entry.
+    Writes are atomic and the least recently used entries are evicted above max_bytes.
+    """
+    def __init__(self, root=ARTIFACTS_FOLDER, max_bytes=ARTIFACTS_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.size = None
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(stage, input_hash=None, **params):
+        description = json.dumps({"stage": stage, "input": input_hash, "params": params}, sort_keys=True, default=str)
+        return f"{stage}-{hash_text(description)}"
+
+    def path(self, key, suffix=""):
+        return os.path.join(self.root, key[-2:], key + suffix)
+
+    def _touch(self, path):
+        try:
+            os.utime(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def get_file(self, key, suffix=""):
+        """Path of the stored file, or None on a miss."""
+        path = self.path(key, suffix)
+        return path if self._touch(path) else None
+
+    def get_bytes(self, key, suffix=""):
+        path = self.get_file(key, suffix)
+        if path is None:
+            return None
+        try:
+            with open(path, "rb") as artifact:
+                return artifact.read()
+        except FileNotFoundError:
+            return None
+
+    def get_text(self, key):
+        data = self.get_bytes(key, ".txt")
+        return data.decode("utf-8") if data is not None else None
+
+    def get_json(self, key):
+        data = self.get_bytes(key, ".json")
+        return json.loads(data) if data is not None else None
+
+    def _write(self, key, suffix, write):
+        """Write through a temporary file in the same folder and rename it into place."""
+        path = self.path(key, suffix)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as temp_file:
+                write(temp_file)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        self._account(os.path.getsize(path))
+        return path
+
+    def put_bytes(self, key, data, suffix=""):
+        return self._write(key, suffix, lambda artifact: artifact.write(data))
+
+    def put_text(self, key, text):
+        return self.put_bytes(key, text.encode("utf-8"), ".txt")
+
+    def put_json(self, key, value):
+        return self.put_bytes(key, json.dumps(value, ensure_ascii=False).encode("utf-8"), ".json")
+
+    def put_file(self, key, source_path, suffix=""):
+        """Store a file, hard linked when the store is on the same file system (files are never modified in place)."""
+        path = self.path(key, suffix)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{threading.get_ident()}.part"
+        try:
+            os.link(source_path, temp_path)
+            os.replace(temp_path, path)
+        except OSError:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            def copy(artifact):
+                with open(source_path, "rb") as source:
+                    shutil.copyfileobj(source, artifact, HASH_CHUNK)
+            return self._write(key, suffix, copy)
+        self._account(os.path.getsize(path))
+        return path
+
+    def materialize(self, key, destination, suffix=""):
+        """Link (or copy) a stored file to destination; returns destination or None on a miss."""
+        path = self.get_file(key, suffix)
+        if path is None:
+            return None
+        folder = os.path.dirname(os.path.abspath(destination))
+        os.makedirs(folder, exist_ok=True)
+        # Linked (or copied) under a unique name and renamed onto destination, so a job reading
+        # destination while another one materializes it never sees it missing or half written
+        fd, temp_path = tempfile.mkstemp(dir=folder, suffix=".part")
+        os.close(fd)
+        try:
+            os.remove(temp_path)
+            try:
+                os.link(path, temp_path)
+            except OSError:
+                shutil.copyfile(path, temp_path)
+            os.replace(temp_path, destination)
+        finally:
+            # Also left behind when destination already was a link to the same file (rename does nothing then)
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        return destination
+
+    def _entries(self):
+        for folder, _, files in os.walk(self.root):
+            for name in files:
+                if not name.endswith(".part"):
+                    path = os.path.join(folder, name)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    yield path, stat.st_mtime, stat.st_size
+
+    def _account(self, added_bytes):
+        with self.lock:
+            if self.size is None:
+                self.size = sum(size for _, _, size in self._entries())
+            else:
+                self.size += added_bytes
+            if self.size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Remove least recently used entries until the store is below 90% of max_bytes."""
+        entries = sorted(self._entries(), key=lambda entry: entry[1])
+        self.size = sum(size for _, _, size in entries)
+        for path, _, size in entries:
+            if self.size <= self.max_bytes * 0.9:
+                break
+            try:
+                os.remove(path)
+                self.size -= size
+                logger.info(f"Evicted artifact {path}")
+            except FileNotFoundError:
+                pass
+
+
+artifact_store = ArtifactStore()
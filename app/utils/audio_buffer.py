@@ -0,0 +1,80 @@
+# audio_buffer.py
+import os
+import tempfile
+import numpy as np
+
+from .ffmpeg_tools import run_ffmpeg
+from .artifact_store import artifact_store, hash_file
+
+import logging
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)  # Set log level if needed
+
+# Whisper and pyannote both work on 16 kHz mono audio
+SAMPLE_RATE = 16000
+# Rate of the dubbed audio track, from TTS output to the final AAC encode (OpenAI speech is 24 kHz)
+PCM_SAMPLE_RATE = int(os.environ.get("PCM_SAMPLE_RATE", 24000))
+# Samples piped to ffmpeg at a time when the track is encoded
+PCM_BLOCK_SAMPLES = int(os.environ.get("PCM_BLOCK_SAMPLES", 1 << 18))
+# Audio longer than this is memory-mapped from disk instead of read into RAM
+MMAP_SECONDS = int(os.environ.get("AUDIO_MMAP_SECONDS", 1800))
+
+
+def load_audio_array(audio_path, sample_rate=SAMPLE_RATE):
+    """
+    Decode the audio file once to mono float32 samples.
+    The samples are kept in the artifact store as a raw .f32 file under the hash of the file content,
+    so a second call, from this job or another one, only maps it, and it counts towards the size limit of the store.
+    """
+    key = artifact_store.key("pcm", hash_file(audio_path), sample_rate=sample_rate)
+    raw_path = artifact_store.get_file(key, ".f32")
+    if raw_path is None:
+        logger.info(f"Decoding {audio_path} to {sample_rate} Hz samples")
+        # Unique name, jobs on the same audio may decode it at the same time
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(audio_path)), suffix=".f32.part")
+        os.close(fd)
+        try:
+            run_ffmpeg(["-i", audio_path, "-vn", "-ac", "1", "-ar", str(sample_rate), "-f", "f32le", "-acodec", "pcm_f32le", temp_path])
+            raw_path = artifact_store.put_file(key, temp_path, ".f32")
+        finally:
+            os.remove(temp_path)
+
+    samples = os.path.getsize(raw_path) // np.dtype(np.float32).itemsize
+    if samples > MMAP_SECONDS * sample_rate:
+        return np.memmap(raw_path, dtype=np.float32, mode="r", shape=(samples,))
+    return np.fromfile(raw_path, dtype=np.float32)
+
+
+def slice_seconds(audio, start_sec, end_sec, sample_rate=SAMPLE_RATE):
+    """Zero-copy view of the samples between start_sec and end_sec."""
+    start = max(int(round(start_sec * sample_rate)), 0)
+    end = min(int(round(end_sec * sample_rate)), len(audio))
+    return audio[start:end]
+
+
+def decode_audio(audio_path, sample_rate=PCM_SAMPLE_RATE):
+    """Mono float32 samples of a (short) audio file, decoded through a pipe without a temporary file."""
+    data = run_ffmpeg(["-i", audio_path, "-vn", "-ac", "1", "-ar", str(sample_rate), "-f", "f32le", "-acodec", "pcm_f32le", "pipe:1"], capture_output=True)
+    return np.frombuffer(data, dtype=np.float32)
+
+
+def new_audio_array(seconds, raw_path, sample_rate=PCM_SAMPLE_RATE):
+    """Silent mono float32 track; tracks longer than MMAP_SECONDS are memory-mapped to raw_path."""
+    samples = int(round(seconds * sample_rate))
+    if seconds > MMAP_SECONDS:
+        return np.memmap(raw_path, dtype=np.float32, mode="w+", shape=(samples,))
+    return np.zeros(samples, dtype=np.float32)
+
+
+def mix_into(track, start_sec, samples, sample_rate=PCM_SAMPLE_RATE):
+    """Adds samples to track from start_sec on, cut at the end of the track."""
+    start = max(int(round(start_sec * sample_rate)), 0)
+    end = min(start + len(samples), len(track))
+    if end > start:
+        track[start:end] += samples[:end - start]
+
+
+def pcm_blocks(track, block_samples=PCM_BLOCK_SAMPLES):
+    """Clipped little-endian float32 pieces of the track for piping, one block in memory at a time."""
+    for start in range(0, len(track), block_samples):
+        yield np.clip(track[start:start + block_samples], -1.0, 1.0).astype("<f4", copy=False).tobytes()
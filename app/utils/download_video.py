@@ -4,8 +4,11 @@ from pytube import YouTube
 from io import BytesIO as MemoryFile
 import requests
 import re
+import tempfile
 from fastapi import UploadFile
 
+from .artifact_store import artifact_store, hash_text
+
 import logging
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO) #Set log level if needed
@@ -50,8 +53,35 @@ def is_youtube_url(url):
     youtube_regex_match = re.match(youtube_regex, url)
     return youtube_regex_match is not None
 
+def url_output_path(url, output_path='downloads'):
+    """Every URL gets its own folder, so two videos with the same title don't collide."""
+    return os.path.join(output_path, hash_text(url)[:16])
+
+
+def cached_download(url, output_path='downloads'):
+    """Path of a previously downloaded video for this URL, restored from the artifact store."""
+    record = artifact_store.get_json(artifact_store.key("download", url=url))
+    if record is None:
+        return None
+    video_path = os.path.join(url_output_path(url, output_path), record["filename"])
+    if os.path.isfile(video_path):
+        return video_path
+    return artifact_store.materialize(artifact_store.key("download", url=url, content=True), video_path, ".mp4")
+
+
+def store_download(url, video_path):
+    """Keep the downloaded video in the artifact store and remember its file name for this URL."""
+    artifact_store.put_file(artifact_store.key("download", url=url, content=True), video_path, ".mp4")
+    artifact_store.put_json(artifact_store.key("download", url=url), {"filename": os.path.basename(video_path)})
+
+
 def download_youtube_video(url, output_path='downloads'):
     logger.info(f"Downloading YouTube video from URL: {url}, output_path: {output_path} ")
+    video_path = cached_download(url, output_path)
+    if video_path is not None:
+        logger.info(f"Video already exists: {video_path}")
+        return video_path
+
     # Create a YouTube object
     youtube = YouTube(url)
     
@@ -63,37 +93,42 @@ def download_youtube_video(url, output_path='downloads'):
     
     # Construct the full path where the video will be saved
     video_filename = f"{video_title}.mp4"
+    output_path = url_output_path(url, output_path)
     video_path = os.path.join(output_path, video_filename)
     
-    # Download the video if it does not exist already
-    if not os.path.isfile(video_path):
-        video_stream.download(output_path=output_path, filename=video_filename)
-        return video_path
-    else:
-        logger.info(f"Video already exists: {video_path}")
-        return video_path
+    video_stream.download(output_path=output_path, filename=video_filename)
+    store_download(url, video_path)
+    return video_path
 
 
 
 def download_file(url, output_path='downloads'):
+    temp_path = None
     try:
+        video_path = cached_download(url, output_path)
+        if video_path is not None:
+            return video_path  # File already exists
+
+        output_path = url_output_path(url, output_path)
         if not os.path.exists(output_path):
             os.makedirs(output_path)
         local_filename = url.split('/')[-1]
         local_filename = sanitize_filename(local_filename)
         video_path = os.path.join(output_path, f"{local_filename}.mp4")
         
-        if os.path.isfile(video_path):
-            return video_path  # File already exists
-        
-        with requests.get(url, stream=True) as r:
+        # Download to a temporary file so an interrupted download is never taken for a complete one
+        fd, temp_path = tempfile.mkstemp(dir=output_path, suffix=".part")
+        with requests.get(url, stream=True) as r, os.fdopen(fd, 'wb') as f:
             r.raise_for_status()
-            with open(video_path, 'wb') as f:
-                for chunk in r.iter_content(chunk_size=8192): 
-                    f.write(chunk)
+            for chunk in r.iter_content(chunk_size=8192): 
+                f.write(chunk)
+        os.replace(temp_path, video_path)
+        store_download(url, video_path)
         return video_path
     except Exception as e:
         logger.error(f"Error downloading file: {e}")
+        if temp_path is not None and os.path.exists(temp_path):
+            os.remove(temp_path)
         return None
 
 def download_video(url, output_path='downloads'):
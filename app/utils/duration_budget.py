@@ -0,0 +1,96 @@
+# duration_budget.py
+import os
+import json
+import threading
+
+from .translation_memory import TRANSLATION_MEMORY_PATH, normalize_sentence
+
+import logging
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)  # Set log level if needed
+
+# Learned speaking rates, kept next to the translation memory so they survive restarts
+DURATION_CALIBRATION_PATH = os.environ.get("DURATION_CALIBRATION_PATH",
+                                           os.path.join(os.path.dirname(TRANSLATION_MEMORY_PATH) or ".", "speech_rates.json"))
+# Characters per second at speed 1.0 assumed for a voice and language without observations
+DEFAULT_CHARS_PER_SECOND = float(os.environ.get("DEFAULT_CHARS_PER_SECOND", 15.0))
+# TTS speeds the budgeter may choose; faster than TTS_MAX_SPEED a shorter translation is asked for
+TTS_MIN_SPEED = float(os.environ.get("TTS_MIN_SPEED", 1.0))
+TTS_MAX_SPEED = float(os.environ.get("TTS_MAX_SPEED", 1.25))
+# Chosen speeds are rounded to steps of this size, so small changes of the learned rates keep the speed
+TTS_SPEED_STEP = float(os.environ.get("TTS_SPEED_STEP", 0.05))
+# Weight of a new observation in the moving average of the speaking rate
+CALIBRATION_WEIGHT = float(os.environ.get("CALIBRATION_WEIGHT", 0.2))
+
+
+class DurationBudget():
+    """
+    Predicts how long a text takes to speak with a voice in a language, from a table of
+    characters per second learned from the audio synthesized before, and picks the TTS speed
+    that makes the speech fit the time slot of its segment.
+    """
+    def __init__(self, path=DURATION_CALIBRATION_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.rates = {}
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as rates_file:
+                self.rates = json.load(rates_file)
+
+    @staticmethod
+    def _key(voice, language):
+        return f"{voice}:{language}"
+
+    @staticmethod
+    def _length(text):
+        return max(len(normalize_sentence(text)), 1)
+
+    def chars_per_second(self, voice, language):
+        with self.lock:
+            return self.rates.get(self._key(voice, language), {}).get("chars_per_second", DEFAULT_CHARS_PER_SECOND)
+
+    def predict(self, text, voice, language, speed=1.0):
+        """Expected seconds of speech."""
+        return self._length(text) / (self.chars_per_second(voice, language) * speed)
+
+    def plan(self, text, voice, language, duration, max_speed=TTS_MAX_SPEED):
+        """
+        (speed, fits) for speaking text within duration seconds.
+        fits is False when even max_speed is too slow; the caller should ask for a shorter text.
+        max_speed is 1.0 for TTS backends without a speed setting.
+        """
+        needed = self.predict(text, voice, language) / duration if duration > 0 else 1.0
+        speed = min(max(needed, TTS_MIN_SPEED), max_speed)
+        # Rounded up to the next step (but not past max_speed), so the speech still fits
+        speed = min(-(-round(speed / TTS_SPEED_STEP, 6) // 1) * TTS_SPEED_STEP, max_speed)
+        return round(speed, 2), needed <= max_speed
+
+    def max_chars(self, voice, language, duration, max_speed=TTS_MAX_SPEED):
+        """Longest text that can be spoken within duration seconds at max_speed."""
+        return int(duration * self.chars_per_second(voice, language) * max_speed)
+
+    def observe(self, text, voice, language, speed, audio_duration):
+        """Learn from audio that was synthesized from text at speed and lasts audio_duration seconds."""
+        if audio_duration <= 0:
+            return
+        rate = self._length(text) / (audio_duration * speed)
+        with self.lock:
+            entry = self.rates.setdefault(self._key(voice, language), {"chars_per_second": rate, "samples": 0})
+            entry["chars_per_second"] += CALIBRATION_WEIGHT * (rate - entry["chars_per_second"])
+            entry["samples"] += 1
+            self._save()
+
+    def _save(self):
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_path = f"{self.path}.{threading.get_ident()}.part"
+        with open(temp_path, "w", encoding="utf-8") as rates_file:
+            json.dump(self.rates, rates_file, indent=1)
+        os.replace(temp_path, self.path)
+
+    def stats(self):
+        with self.lock:
+            return dict(self.rates)
+
+
+duration_budget = DurationBudget()
@@ -1,8 +1,11 @@
 # extract.py
 import os
 import logging
+import threading
 from moviepy.editor import VideoFileClip
 
+from .artifact_store import artifact_store, hash_file
+
 # Set up logging
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -17,20 +20,25 @@ def extract_audio(video_path, output_path='downloads'):
         audio_filename = os.path.splitext(os.path.basename(video_path))[0] + ".wav"
         audio_path = os.path.join(output_path, audio_filename)
 
-        # Check if the audio file already exists
-        if os.path.exists(audio_path):
+        # Check if the audio of this exact video was already extracted
+        audio_key = artifact_store.key("audio", hash_file(video_path))
+        if artifact_store.materialize(audio_key, audio_path, ".wav"):
             logger.info(f"Audio file already exists: {audio_path}")
             return audio_path
 
-        # Extract the audio
+        # Extract the audio into a temporary file and rename it, so concurrent jobs on the same
+        # video never see a half written file and a link into the artifact store is never written through
+        temp_path = os.path.join(output_path, f".{threading.get_ident()}.{audio_filename}")
         video_clip = VideoFileClip(video_path)
         audio_clip = video_clip.audio
-        audio_clip.write_audiofile(audio_path)
+        audio_clip.write_audiofile(temp_path)
+        os.replace(temp_path, audio_path)
 
         # Close the clips to free up resources
         audio_clip.close()
         video_clip.close()
 
+        artifact_store.put_file(audio_key, audio_path, ".wav")
         return audio_path
     except Exception as e:
         logger.error(f"Error extracting audio: {e}")
@@ -0,0 +1,179 @@
+# ffmpeg_tools.py
+import os
+import json
+import tempfile
+import subprocess
+from collections import Counter
+
+import logging
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)  # Set log level if needed
+
+FFMPEG_BINARY = os.environ.get("FFMPEG_BINARY", "ffmpeg")
+FFPROBE_BINARY = os.environ.get("FFPROBE_BINARY", "ffprobe")
+
+# Stream parameters that have to be identical for the concat demuxer to join files without re-encoding
+VIDEO_KEYS = ("codec_name", "profile", "width", "height", "pix_fmt", "r_frame_rate", "time_base")
+AUDIO_KEYS = ("codec_name", "sample_rate", "channels")
+
+
+def run_ffmpeg(args, capture_output=False):
+    """
+    Run ffmpeg with the given arguments, raising RuntimeError with its stderr on failure.
+    With capture_output the bytes ffmpeg writes to pipe:1 are returned.
+    """
+    command = [FFMPEG_BINARY, "-hide_banner", "-loglevel", "error", "-y"] + list(args)
+    logger.debug(f"Running: {' '.join(command)}")
+    result = subprocess.run(command, stdout=subprocess.PIPE if capture_output else subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed ({result.returncode}): {result.stderr.decode(errors='replace').strip()}")
+    return result.stdout
+
+
+def mux_pcm_track(video_path, blocks, sample_rate, output_file, channels=1):
+    """
+    Encode float32 PCM to AAC and mux it as the only audio stream of video_path, copying the video.
+    blocks yields the interleaved little-endian float32 samples in pieces (e.g. slices of a numpy array),
+    which are piped to ffmpeg, so the track is encoded exactly once and never written as an intermediate file.
+    """
+    command = [FFMPEG_BINARY, "-hide_banner", "-loglevel", "error", "-y",
+        "-i", video_path,
+        "-f", "f32le", "-ar", str(sample_rate), "-ac", str(channels), "-i", "pipe:0",
+        "-map", "0:v:0",
+        "-map", "1:a:0",
+        "-c:v", "copy",
+        "-c:a", "aac",
+        "-movflags", "+faststart",
+        output_file]
+    logger.debug(f"Running: {' '.join(command)}")
+    # stderr goes to a file, a full pipe would block ffmpeg while it is still reading the samples
+    with tempfile.TemporaryFile() as errors:
+        process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=errors)
+        try:
+            for block in blocks:
+                process.stdin.write(block)
+        except BrokenPipeError:
+            # ffmpeg stopped reading, its exit code and stderr tell why
+            pass
+        finally:
+            try:
+                process.stdin.close()
+            except BrokenPipeError:
+                pass
+            returncode = process.wait()
+        if returncode != 0:
+            errors.seek(0)
+            raise RuntimeError(f"ffmpeg failed ({returncode}): {errors.read().decode(errors='replace').strip()}")
+    logger.info(f"Muxed PCM audio onto {video_path}: {output_file}")
+    return output_file
+
+
+def probe_signature(path):
+    """
+    Codec parameters of the first video and audio stream of a file, as a hashable tuple.
+    """
+    result = subprocess.run(
+        [FFPROBE_BINARY, "-v", "error", "-show_entries", "stream=codec_type," + ",".join(sorted(set(VIDEO_KEYS + AUDIO_KEYS))),
+         "-of", "json", path],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffprobe failed for {path}: {result.stderr.decode(errors='replace').strip()}")
+    streams = json.loads(result.stdout).get("streams", [])
+    video = next((stream for stream in streams if stream.get("codec_type") == "video"), None)
+    audio = next((stream for stream in streams if stream.get("codec_type") == "audio"), None)
+    return (
+        tuple(video.get(key) for key in VIDEO_KEYS) if video else None,
+        tuple(audio.get(key) for key in AUDIO_KEYS) if audio else None,
+    )
+
+
+def conform_video_file(path, signature, output_file):
+    """
+    Re-encode one file to the codec parameters of signature so it can be stream-copied with the others.
+    """
+    video, audio = signature
+    args = ["-i", path]
+    audio_input = "0:a:0"
+    if audio is not None and probe_signature(path)[1] is None:
+        # Add a silent track so every part has the same streams
+        args += ["-f", "lavfi", "-i", f"anullsrc=sample_rate={audio[1]}", "-shortest"]
+        audio_input = "1:a:0"
+    if video is not None:
+        codec_name, profile, width, height, pix_fmt, frame_rate, time_base = video
+        args += ["-map", "0:v:0", "-c:v", codec_name, "-s", f"{width}x{height}", "-pix_fmt", pix_fmt, "-r", frame_rate]
+        if time_base and "/" in time_base:
+            args += ["-video_track_timescale", time_base.split("/")[1]]
+    if audio is not None:
+        codec_name, sample_rate, channels = audio
+        args += ["-map", audio_input, "-c:a", codec_name, "-ar", str(sample_rate), "-ac", str(channels)]
+    run_ffmpeg(args + [output_file])
+    return output_file
+
+
+def concat_video_files(files, output_file):
+    """
+    Join files in order with ffmpeg's concat demuxer, without re-encoding.
+    Files whose codec parameters differ from the majority are re-encoded first, one at a time,
+    so memory use does not depend on the number of files.
+    """
+    signatures = [probe_signature(path) for path in files]
+    reference = Counter(signatures).most_common(1)[0][0]
+
+    parts = []
+    conformed = []
+    try:
+        for path, signature in zip(files, signatures):
+            if signature != reference:
+                logger.info(f"Re-encoding {path} to match the other segments")
+                path = conform_video_file(path, reference, f"{os.path.splitext(path)[0]}.conform.mp4")
+                conformed.append(path)
+            parts.append(path)
+
+        list_file = f"{os.path.splitext(output_file)[0]}.concat.txt"
+        with open(list_file, "w", encoding="utf-8") as concat_list:
+            for path in parts:
+                escaped_path = os.path.abspath(path).replace("'", "'\\''")
+                concat_list.write(f"file '{escaped_path}'\n")
+        conformed.append(list_file)
+
+        run_ffmpeg(["-f", "concat", "-safe", "0", "-i", list_file, "-c", "copy", "-movflags", "+faststart", output_file])
+    finally:
+        for path in conformed:
+            if os.path.exists(path):
+                os.remove(path)
+    logger.info(f"Concatenated {len(files)} files ({len(signatures) - signatures.count(reference)} re-encoded): {output_file}")
+    return output_file
+
+
+def concat_audio_files(files, output_file, codec="libmp3lame", bitrate="128k", output_format="mp3"):
+    """
+    Join audio files with the concat filter: every input is decoded (dropping the encoder delay and
+    padding of each MP3) and the joined samples are encoded once, so the boundaries don't glitch.
+    """
+    if len(files) == 1:
+        os.replace(files[0], output_file)
+        return output_file
+    args = []
+    for path in files:
+        args += ["-i", path]
+    inputs = "".join(f"[{index}:a:0]" for index in range(len(files)))
+    run_ffmpeg(args + [
+        "-filter_complex", f"{inputs}concat=n={len(files)}:v=0:a=1[a]",
+        "-map", "[a]",
+        "-c:a", codec,
+    ] + (["-b:a", bitrate] if bitrate else []) + [
+        "-f", output_format,
+        output_file,
+    ])
+    logger.info(f"Joined {len(files)} audio chunks: {output_file}")
+    return output_file
+
+
+def probe_duration(path):
+    """Duration of the media file in seconds."""
+    result = subprocess.run(
+        [FFPROBE_BINARY, "-v", "error", "-show_entries", "format=duration", "-of", "json", path],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffprobe failed for {path}: {result.stderr.decode(errors='replace').strip()}")
+    return float(json.loads(result.stdout)["format"]["duration"])
@@ -0,0 +1,78 @@
+# http_clients.py
+import os
+import threading
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from openai import OpenAI
+from mistralai.client import MistralClient
+
+import logging
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)  # Set log level if needed
+
+# Seconds to wait for a connection and for a whole response
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", 10))
+HTTP_TIMEOUT = float(os.environ.get("HTTP_TIMEOUT", 120))
+# Keep-alive connections kept open per provider and base URL
+HTTP_POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", 16))
+# Retries inside the clients; rate_limiter retries 429s (honoring Retry-After for every caller of the key),
+# 5xx responses, timeouts and dropped connections, so the clients don't retry on their own by default
+HTTP_MAX_RETRIES = int(os.environ.get("HTTP_MAX_RETRIES", 0))
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def _shared(key, factory):
+    """One client per key for the whole process; the clients are safe to use from several threads."""
+    with _clients_lock:
+        if key not in _clients:
+            logger.info(f"Opening connection pool for {key[0]} {key[1] or ''}")
+            _clients[key] = factory()
+        return _clients[key]
+
+
+def openai_client(api_key, base_url=None):
+    """OpenAI (or OpenAI compatible, e.g. the local TTS server) client with a keep-alive pool."""
+    def factory():
+        http_client = httpx.Client(
+            limits=httpx.Limits(max_connections=HTTP_POOL_SIZE, max_keepalive_connections=HTTP_POOL_SIZE),
+            timeout=httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+        )
+        return OpenAI(api_key=api_key, base_url=base_url, http_client=http_client, max_retries=HTTP_MAX_RETRIES)
+    return _shared(("openai", base_url, api_key), factory)
+
+
+def mistral_client(api_key):
+    """MistralClient keeps its own httpx client, so reusing the instance reuses its connections."""
+    return _shared(("mistral", None, api_key), lambda: MistralClient(api_key=api_key, timeout=HTTP_TIMEOUT, max_retries=HTTP_MAX_RETRIES))
+
+
+def http_session(base_url):
+    """requests.Session with a keep-alive pool for plain HTTP services such as Ollama."""
+    def factory():
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+    return _shared(("session", base_url, None), factory)
+
+
+def request_timeout():
+    """(connect, read) timeout for requests calls."""
+    return (HTTP_CONNECT_TIMEOUT, HTTP_TIMEOUT)
+
+
+def close_clients():
+    with _clients_lock:
+        for client in _clients.values():
+            close = getattr(client, "close", None) or getattr(getattr(client, "_client", None), "close", None)
+            try:
+                if close is not None:
+                    close()
+            except Exception as e:
+                logger.warning(f"Error closing HTTP client: {e}")
+        _clients.clear()
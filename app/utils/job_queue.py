@@ -0,0 +1,112 @@
+# job_queue.py
+import os
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import logging
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)  # Set log level if needed
+
+# Number of translation jobs allowed to run at the same time
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 2))
+# Jobs waiting for a free worker before new submissions are rejected
+MAX_PENDING_JOBS = int(os.environ.get("MAX_PENDING_JOBS", 16))
+# Finished jobs are forgotten after this many seconds
+JOB_RETENTION = int(os.environ.get("JOB_RETENTION", 24 * 3600))
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class Job():
+    def __init__(self, job_id=None):
+        self.id = job_id or str(uuid.uuid4())
+        self.state = QUEUED
+        self.stage = None
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def set_stage(self, stage):
+        """Record the pipeline stage the job is currently in."""
+        logger.info(f"Job {self.id}: {stage}")
+        self.stage = stage
+
+    @property
+    def finished(self):
+        return self.state in (COMPLETED, FAILED)
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "state": self.state,
+            "stage": self.stage,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobQueue():
+    """
+    Runs long translation pipelines on a bounded thread pool so the event loop stays free.
+    The job function is called as func(job, *args, **kwargs) and may report progress with job.set_stage().
+    """
+    def __init__(self, max_workers=JOB_WORKERS, max_pending=MAX_PENDING_JOBS, retention=JOB_RETENTION):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self.max_pending = max_pending
+        self.retention = retention
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def submit(self, func, *args, **kwargs):
+        with self.lock:
+            self._prune()
+            pending = sum(1 for job in self.jobs.values() if job.state == QUEUED)
+            if pending >= self.max_pending:
+                raise QueueFullError(f"Too many pending jobs ({pending}).")
+            job = Job()
+            self.jobs[job.id] = job
+        self.executor.submit(self._run, job, func, args, kwargs)
+        logger.info(f"Job {job.id} queued")
+        return job
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def _run(self, job, func, args, kwargs):
+        job.state = RUNNING
+        job.started_at = time.time()
+        try:
+            job.result = func(job, *args, **kwargs)
+            job.state = COMPLETED
+        except Exception as e:
+            logger.exception(f"Job {job.id} failed at stage {job.stage}: {e}")
+            job.error = str(e)
+            job.state = FAILED
+        finally:
+            job.finished_at = time.time()
+
+    def _prune(self):
+        """Drop finished jobs older than the retention period."""
+        now = time.time()
+        expired = [job_id for job_id, job in self.jobs.items()
+                   if job.finished and now - job.finished_at > self.retention]
+        for job_id in expired:
+            del self.jobs[job_id]
+
+    def shutdown(self, wait=False):
+        self.executor.shutdown(wait=wait)
@@ -0,0 +1,147 @@
+# model_registry.py
+import os
+import time
+import queue
+import threading
+from contextlib import contextmanager
+
+import logging
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)  # Set log level if needed
+
+WHISPER_MODEL = os.environ.get("WHISPER_MODEL", "small")
+# Number of Whisper instances handed out concurrently (each one holds its own weights)
+WHISPER_POOL_SIZE = int(os.environ.get("WHISPER_POOL_SIZE", 1))
+DIARIZATION_MODEL = os.environ.get("DIARIZATION_MODEL", "pyannote/speaker-diarization-3.1")
+# Hugging Face access token of an account that accepted the conditions of DIARIZATION_MODEL
+HF_TOKEN = os.environ.get("HF_TOKEN")
+
+
+def _process_rss():
+    """Resident memory of this process in bytes (0 when it can't be read)."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def _gpu_memory():
+    try:
+        import torch
+        return torch.cuda.memory_allocated() if torch.cuda.is_available() else 0
+    except ImportError:
+        return 0
+
+
+def _device():
+    import torch
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+def _load_whisper():
+    import whisper
+    return whisper.load_model(WHISPER_MODEL, device=_device())
+
+
+def _load_diarization():
+    if not HF_TOKEN:
+        raise RuntimeError(f"HF_TOKEN is not set: {DIARIZATION_MODEL} needs a Hugging Face access token to be downloaded")
+    import torch
+    from pyannote.audio import Pipeline
+    pipeline = Pipeline.from_pretrained(DIARIZATION_MODEL, use_auth_token=HF_TOKEN)
+    # if GPU is available, use it
+    if torch.cuda.is_available():
+        pipeline.to(torch.device("cuda"))
+    return pipeline
+
+
+class _ModelEntry():
+    def __init__(self, name, loader, pool_size):
+        self.name = name
+        self.loader = loader
+        self.pool_size = max(1, pool_size)
+        self.instances = []
+        self.available = queue.Queue()
+        self.lock = threading.Lock()
+        self.load_times = []
+        self.memory_bytes = 0
+        self.gpu_memory_bytes = 0
+
+
+class ModelRegistry():
+    """
+    Loads every model at most pool_size times per process.
+    get() returns a shared instance, lease() hands out an instance exclusively to one thread.
+    """
+    def __init__(self):
+        self.entries = {}
+        # Loads are serialized so memory deltas can be attributed to one model
+        self.load_lock = threading.Lock()
+
+    def register(self, name, loader, pool_size=1):
+        self.entries[name] = _ModelEntry(name, loader, pool_size)
+
+    def _entry(self, name):
+        if name not in self.entries:
+            raise KeyError(f"Model is not registered: {name}")
+        return self.entries[name]
+
+    def _load(self, entry):
+        with self.load_lock:
+            rss_before, gpu_before = _process_rss(), _gpu_memory()
+            start_time = time.time()
+            model = entry.loader()
+            load_time = time.time() - start_time
+            entry.load_times.append(load_time)
+            entry.memory_bytes += max(0, _process_rss() - rss_before)
+            entry.gpu_memory_bytes += max(0, _gpu_memory() - gpu_before)
+        entry.instances.append(model)
+        logger.info(f"Loaded model {entry.name} ({len(entry.instances)}/{entry.pool_size}) in {load_time:.1f}s")
+        return model
+
+    def get(self, name):
+        """Shared instance, for models that are safe to use from several threads."""
+        entry = self._entry(name)
+        with entry.lock:
+            if not entry.instances:
+                entry.available.put(self._load(entry))
+            return entry.instances[0]
+
+    @contextmanager
+    def lease(self, name):
+        """Exclusive instance; blocks while all pool_size instances are in use."""
+        entry = self._entry(name)
+        try:
+            model = entry.available.get_nowait()
+        except queue.Empty:
+            with entry.lock:
+                model = self._load(entry) if len(entry.instances) < entry.pool_size else None
+            if model is None:
+                model = entry.available.get()
+        try:
+            yield model
+        finally:
+            entry.available.put(model)
+
+    def warm_up(self, names=None):
+        """Load one instance of each given model (all registered models by default)."""
+        for name in names or list(self.entries):
+            self.get(name)
+
+    def stats(self):
+        return {
+            name: {
+                "loaded_instances": len(entry.instances),
+                "pool_size": entry.pool_size,
+                "load_time_seconds": sum(entry.load_times),
+                "memory_bytes": entry.memory_bytes,
+                "gpu_memory_bytes": entry.gpu_memory_bytes,
+            }
+            for name, entry in self.entries.items()
+        }
+
+
+model_registry = ModelRegistry()
+model_registry.register("whisper", _load_whisper, pool_size=WHISPER_POOL_SIZE)
+model_registry.register("diarization", _load_diarization, pool_size=1)
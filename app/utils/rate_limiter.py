@@ -0,0 +1,240 @@
+# rate_limiter.py
+import os
+import time
+import threading
+from contextlib import contextmanager, ExitStack
+
+from .artifact_store import hash_text
+
+import logging
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)  # Set log level if needed
+
+# Requests and tokens per minute allowed for each provider and API key (0 means no limit),
+# and the highest number of calls in flight the adaptive limit can grow to
+PROVIDER_LIMITS = {
+    "openai": {
+        "requests_per_minute": int(os.environ.get("OPENAI_RPM", 500)),
+        "tokens_per_minute": int(os.environ.get("OPENAI_TPM", 200000)),
+        "max_concurrency": int(os.environ.get("OPENAI_MAX_CONCURRENCY", 8)),
+    },
+    "mistralai": {
+        "requests_per_minute": int(os.environ.get("MISTRALAI_RPM", 300)),
+        "tokens_per_minute": int(os.environ.get("MISTRALAI_TPM", 500000)),
+        "max_concurrency": int(os.environ.get("MISTRALAI_MAX_CONCURRENCY", 4)),
+    },
+    "openai_tts": {
+        "requests_per_minute": int(os.environ.get("OPENAI_TTS_RPM", 50)),
+        "tokens_per_minute": 0,
+        "max_concurrency": int(os.environ.get("OPENAI_TTS_MAX_CONCURRENCY", 4)),
+    },
+}
+# Limits of providers not listed above, e.g. Ollama or the local TTS server
+DEFAULT_LIMITS = {"requests_per_minute": 0, "tokens_per_minute": 0, "max_concurrency": int(os.environ.get("DEFAULT_MAX_CONCURRENCY", 4))}
+# Rate limited calls retried after the Retry-After pause before the error is returned to the caller
+RATE_LIMIT_RETRIES = int(os.environ.get("RATE_LIMIT_RETRIES", 4))
+# Pause when a 429 comes without a Retry-After header
+RATE_LIMIT_BACKOFF = float(os.environ.get("RATE_LIMIT_BACKOFF", 2.0))
+# Retries of 5xx responses, timeouts and dropped connections, after TRANSIENT_BACKOFF seconds doubled every time
+TRANSIENT_RETRIES = int(os.environ.get("TRANSIENT_RETRIES", 2))
+TRANSIENT_BACKOFF = float(os.environ.get("TRANSIENT_BACKOFF", 1.0))
+# Exception class names of the OpenAI, Mistral, httpx and requests clients for timeouts and lost connections
+TRANSIENT_ERROR_NAMES = ("Timeout", "Connection", "ConnectError", "ReadError", "RemoteProtocolError")
+
+
+class TokenBucket():
+    """Refills per_minute units evenly over a minute, holding at most one minute worth."""
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        """Seconds until amount is available (amounts above capacity only wait for a full bucket)."""
+        self._refill()
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount):
+        self.level -= min(amount, self.capacity)
+
+
+def error_status(error):
+    """HTTP status of an exception of the OpenAI, Mistral or requests clients, or None."""
+    response = getattr(error, "response", None)
+    return getattr(error, "status_code", None) or getattr(error, "http_status", None) or getattr(response, "status_code", None)
+
+
+def rate_limit_status(error):
+    """(True, Retry-After seconds or None) when the exception is a 429 of the OpenAI, Mistral or requests clients."""
+    response = getattr(error, "response", None)
+    status = error_status(error)
+    if status != 429:
+        return False, None
+    headers = getattr(response, "headers", None) or getattr(error, "headers", None) or {}
+    retry_after = headers.get("retry-after") or headers.get("Retry-After")
+    try:
+        return True, float(retry_after) if retry_after is not None else None
+    except ValueError:
+        return True, None
+
+
+def is_transient(error):
+    """True for errors a retry may fix: 5xx responses, timeouts and dropped connections."""
+    status = error_status(error)
+    if isinstance(status, int):
+        return status >= 500
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    return any(name in cls.__name__ for cls in type(error).__mro__ for name in TRANSIENT_ERROR_NAMES)
+
+
+class ProviderLimiter():
+    """
+    Request and token buckets of one provider and API key, with an AIMD concurrency limit:
+    every success raises the limit by 1/limit, every 429 halves it and pauses all callers for Retry-After.
+    """
+    def __init__(self, name, requests_per_minute=0, tokens_per_minute=0, max_concurrency=4):
+        self.name = name
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.max_concurrency = max_concurrency
+        self.limit = float(max_concurrency)
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.condition = threading.Condition()
+
+    def _wait_time(self, tokens):
+        waits = [self.paused_until - time.monotonic()]
+        if self.in_flight >= int(self.limit):
+            waits.append(None)
+        if self.requests is not None:
+            waits.append(self.requests.wait_time(1))
+        if self.tokens is not None and tokens:
+            waits.append(self.tokens.wait_time(tokens))
+        if None in waits:
+            return None
+        return max(waits)
+
+    @contextmanager
+    def slot(self, tokens=0):
+        with self.condition:
+            while True:
+                wait_time = self._wait_time(tokens)
+                if wait_time is not None and wait_time <= 0:
+                    break
+                # Woken up by a finished call, or after the time the buckets need to refill
+                self.condition.wait(timeout=wait_time)
+            self.in_flight += 1
+            if self.requests is not None:
+                self.requests.take(1)
+            if self.tokens is not None and tokens:
+                self.tokens.take(tokens)
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.in_flight -= 1
+                self.condition.notify_all()
+
+    def on_success(self):
+        with self.condition:
+            self.limit = min(self.max_concurrency, self.limit + 1.0 / self.limit)
+
+    def on_rate_limited(self, retry_after=None):
+        with self.condition:
+            self.limit = max(1.0, self.limit / 2)
+            pause = retry_after if retry_after is not None else RATE_LIMIT_BACKOFF
+            self.paused_until = max(self.paused_until, time.monotonic() + pause)
+        logger.warning(f"{self.name} rate limited, concurrency limit {int(self.limit)}, pausing {pause:.1f}s")
+
+    def to_dict(self):
+        return {"concurrency_limit": int(self.limit), "in_flight": self.in_flight,
+                "paused_seconds": max(0.0, self.paused_until - time.monotonic())}
+
+
+class RateLimiter():
+    """Limiters per provider and API key, shared by translation and speech synthesis."""
+    def __init__(self, limits=PROVIDER_LIMITS):
+        self.limits = limits
+        self.limiters = {}
+        self.lock = threading.Lock()
+
+    def limiter(self, provider, api_key=None):
+        # The key itself is not kept, only its hash
+        key = (provider, hash_text(api_key or "")[:12])
+        with self.lock:
+            if key not in self.limiters:
+                self.limiters[key] = ProviderLimiter(provider, **self.limits.get(provider, DEFAULT_LIMITS))
+            return self.limiters[key]
+
+    def _call(self, provider, api_key, function, args, kwargs, tokens, hold):
+        """
+        (result, slot) of function(*args, **kwargs) called within the limits of the provider and API key.
+        With hold the slot is returned still taken (an ExitStack that releases it), else it is None.
+        A 429 lowers the concurrency, waits for Retry-After and retries; 5xx responses, timeouts and
+        dropped connections are retried after a backoff; other errors are raised at once.
+        """
+        limiter = self.limiter(provider, api_key)
+        rate_limited_attempts = 0
+        transient_attempts = 0
+        while True:
+            slot = ExitStack()
+            slot.enter_context(limiter.slot(tokens))
+            try:
+                result = function(*args, **kwargs)
+            except Exception as e:
+                slot.close()
+                rate_limited, retry_after = rate_limit_status(e)
+                if rate_limited and rate_limited_attempts < RATE_LIMIT_RETRIES:
+                    rate_limited_attempts += 1
+                    limiter.on_rate_limited(retry_after)
+                    continue
+                if not rate_limited and transient_attempts < TRANSIENT_RETRIES and is_transient(e):
+                    delay = TRANSIENT_BACKOFF * 2 ** transient_attempts
+                    transient_attempts += 1
+                    logger.warning(f"{provider} call failed ({e}), retrying in {delay:.1f}s")
+                    time.sleep(delay)
+                    continue
+                raise
+            except BaseException:
+                slot.close()
+                raise
+            limiter.on_success()
+            if hold:
+                return result, slot
+            slot.close()
+            return result, None
+
+    def call(self, provider, api_key, function, *args, tokens=0, **kwargs):
+        """Call function(*args, **kwargs) within the limits of the provider and API key, retrying 429s and transient errors."""
+        return self._call(provider, api_key, function, args, kwargs, tokens, hold=False)[0]
+
+    def stream(self, provider, api_key, function, *args, tokens=0, **kwargs):
+        """
+        Yields the items of the iterable function(*args, **kwargs) returns (a streamed response), keeping the
+        slot until the stream is read or closed, so open streams count against the concurrency limit.
+        Only opening the stream is retried, items already yielded can't be taken back.
+        """
+        result, slot = self._call(provider, api_key, function, args, kwargs, tokens, hold=True)
+        with slot:
+            try:
+                yield from result
+            finally:
+                close = getattr(result, "close", None)
+                if close is not None:
+                    close()
+
+    def stats(self):
+        with self.lock:
+            limiters = dict(self.limiters)
+        return {f"{provider}:{key}": limiter.to_dict() for (provider, key), limiter in limiters.items()}
+
+
+rate_limiter = RateLimiter()
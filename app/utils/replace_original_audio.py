@@ -1,11 +1,15 @@
 import os
-from moviepy.editor import VideoFileClip, concatenate_videoclips, AudioFileClip, vfx
+from moviepy.editor import VideoFileClip, concatenate_videoclips, AudioFileClip
 import logging
 
+from .time_stretch import stretch_clip, time_stretch
+
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)  # Set log level if needed
 
 translations_folder = os.environ.get("TRANSLATIONS_FOLDER", "./translations")
+# Seconds speech may run past its time range before it is sped up; shorter overruns are cut
+STRETCH_TOLERANCE = float(os.environ.get("STRETCH_TOLERANCE", 0.1))
 
 def split_audio_into_chunks(audio_clip, chunk_duration, video_duration):
     """
@@ -16,8 +20,8 @@ def split_audio_into_chunks(audio_clip, chunk_duration, video_duration):
     if audio_duration > video_duration:
         # Calculate the speed change required to match the video duration
         speed_change_factor = audio_duration / video_duration
-        # Apply the speed change
-        audio_clip = audio_clip.fx(vfx.speedx, speed_change_factor)
+        # Apply the speed change, keeping the pitch
+        audio_clip = stretch_clip(audio_clip, speed_change_factor)
         # Update the audio duration after the speed change
         audio_duration = video_duration
 
@@ -30,6 +34,52 @@ def split_audio_into_chunks(audio_clip, chunk_duration, video_duration):
         chunks.append(chunk)
     return chunks
 
+def speed_change_factor(audio_duration, duration, tolerance=STRETCH_TOLERANCE):
+    """
+    How many times faster the audio has to play to end with the time range (always > 1), or None when it
+    needs no change or the lengths are too far apart to adjust. Audio that already fits is never slowed
+    down: the speed was planned by duration_budget and the rest of the range stays silent.
+    """
+    if not audio_duration or not duration or audio_duration <= duration + tolerance:
+        return None
+    # Golden ratio and its reciprocal
+    golden_ratio = 1.34
+    golden_ratio_reciprocal = 1 / golden_ratio
+
+    # Calculate the ratio of the shorter duration to the longer duration
+    duration_ratio = min(audio_duration, duration) / max(audio_duration, duration)
+
+    # Determine if adjustment is needed based on the golden ratio thresholds
+    if golden_ratio_reciprocal <= duration_ratio <= golden_ratio:
+        return audio_duration / duration
+    return None
+
+def fit_audio_to_duration(audio, duration):
+    """
+    Load the audio (path or AudioFileClip) and speed it up when it runs past the end
+    of the time range it has to fit in, by not too much.
+    """
+    if not isinstance(audio, AudioFileClip):
+        audio = AudioFileClip(audio)
+    logger.info(f"audio.clip.duration: {audio.duration}")
+
+    factor = speed_change_factor(audio.duration, duration)
+    if factor is not None:
+        # Apply the speed change, keeping the pitch
+        audio = stretch_clip(audio, factor)
+    return audio
+
+def fit_samples_to_duration(samples, duration, sample_rate):
+    """
+    fit_audio_to_duration for float32 samples: sped up with the same rule, then cut to the duration.
+    Shorter audio is returned as is.
+    """
+    factor = speed_change_factor(len(samples) / sample_rate, duration)
+    if factor is not None:
+        logger.info(f"Time stretching {len(samples) / sample_rate:.2f}s of audio by {factor:.3f}")
+        samples = time_stretch(samples, factor)
+    return samples[:int(round(duration * sample_rate))]
+
 def replace_original_audio_intime_range(video_clip, audio, start_time, end_time, output_file = f"{translations_folder}/temp.mp4"):
     """
     Replace the audio of the video clip with the audio from the given path
@@ -42,30 +92,7 @@ def replace_original_audio_intime_range(video_clip, audio, start_time, end_time,
         logger.info(f"Time range: {start_time}-{end_time}. Time range is in seconds: {video_clip_duration}")
         logger.info(f"Video_clip.duration: {video_clip.duration}")
         
-        # Load the audio clip
-        if not isinstance(audio, AudioFileClip):
-            audio = AudioFileClip(audio)
-        logger.info(f"audio.clip.duration: {audio.duration}")
-
-        # Golden ratio and its reciprocal
-        golden_ratio = 1.34
-        golden_ratio_reciprocal = 1 / golden_ratio
-
-        # Calculate the ratio of the shorter duration to the longer duration
-        duration_ratio = min(audio.duration, video_clip_duration) / max(audio.duration, video_clip_duration)
-
-        # Determine if adjustment is needed based on the golden ratio thresholds
-        if golden_ratio_reciprocal <= duration_ratio <= golden_ratio:
-            if audio.duration > video_clip_duration:
-                # Audio is longer than video, and difference is significant
-                speed_change_factor = video_clip_duration / audio.duration
-            else:
-                # Audio is shorter than video, and difference is significant
-                speed_change_factor = audio.duration / video_clip_duration
-
-            # Apply the speed change
-            audio = audio.fx(vfx.speedx, speed_change_factor)
-
+        audio = fit_audio_to_duration(audio, video_clip_duration)
 
         new_subclip = video_clip.subclip(t_start=start_time, t_end=end_time).set_audio(audio)
 
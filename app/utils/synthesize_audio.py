@@ -2,8 +2,14 @@ import os
 from gtts import gTTS, lang
 
 from moviepy.editor import VideoFileClip, concatenate_audioclips
-from openai import OpenAI
 import re
+from concurrent.futures import ThreadPoolExecutor
+
+from .artifact_store import ArtifactStore, hash_text
+from .translation_memory import normalize_sentence
+from .http_clients import openai_client
+from .rate_limiter import rate_limiter
+from .ffmpeg_tools import concat_audio_files
 
 import logging
 logger = logging.getLogger(__name__)
@@ -13,84 +19,85 @@ logger.setLevel(logging.INFO)  # Set log level if needed
 # Get the path to the translations folder from the environment variable
 translations_folder = os.environ.get("TRANSLATIONS_FOLDER", "./translations")
 
-def synthesize_audio(translated_text, target_language, translations="translations", simulate_male_voice=False):
-    LANGUAGES = {
-        "Afrikaans": "af",
-        "Albanian": "sq",
-        "Arabic": "ar",
-        "Armenian": "hy",
-        "Bengali": "bn",
-        "Bosnian": "bs",
-        "Catalan": "ca",
-        "Chinese": "zh",
-        "Croatian": "hr",
-        "Czech": "cs",
-        "Danish": "da",
-        "Dutch": "nl",
-        "English": "en",
-        "Esperanto": "eo",
-        "Estonian": "et",
-        "Filipino": "tl",
-        "Finnish": "fi",
-        "French": "fr",
-        "German": "de",
-        "Greek": "el",
-        "Gujarati": "gu",
-        "Hebrew": "iw",
-        "Hindi": "hi",
-        "Hungarian": "hu",
-        "Icelandic": "is",
-        "Indonesian": "id",
-        "Italian": "it",
-        "Japanese": "ja",
-        "Javanese": "jw",
-        "Kannada": "kn",
-        "Kazakh": "kk",
-        "Khmer": "km",
-        "Korean": "ko",
-        "Kurdish": "ku",
-        "Kyrgyz": "ky",
-        "Lao": "lo",
-        "Latin": "la",
-        "Latvian": "lv",
-        "Lithuanian": "lt",
-        "Macedonian": "mk",
-        "Malagasy": "mg",
-        "Malay": "ms",
-        "Malayalam": "ml",
-        "Maltese": "mt",
-        "Marathi": "mr",
-        "Mongolian": "mn",
-        "Nepali": "ne",
-        "Norwegian": "no",
-        "Persian": "fa",
-        "Polish": "pl",
-        "Portuguese": "pt",
-        "Punjabi": "pa",
-        "Romanian": "ro",
-        "Russian": "ru",
-        "Serbian": "sr",
-        "Sinhala": "si",
-        "Slovak": "sk",
-        "Slovenian": "sl",
-        "Spanish": "es",  # Corrected the language code for Spanish
-        "Swahili": "sw",
-        "Swedish": "sv",
-        "Tamil": "ta",
-        "Telugu": "te",
-        "Thai": "th",
-        "Turkish": "tr",
-        "Ukrainian": "uk",
-        "Urdu": "ur",
-        "Uzbek": "uz",
-        "Vietnamese": "vi",
-        "Welsh": "cy",
-        "Xhosa": "xh",
-        "Yiddish": "yi",
-        "Yoruba": "yo",
-        "Zulu": "zu",
-    }
+# gTTS language codes by language name
+LANGUAGES = {
+    "Afrikaans": "af",
+    "Albanian": "sq",
+    "Arabic": "ar",
+    "Armenian": "hy",
+    "Bengali": "bn",
+    "Bosnian": "bs",
+    "Catalan": "ca",
+    "Chinese": "zh",
+    "Croatian": "hr",
+    "Czech": "cs",
+    "Danish": "da",
+    "Dutch": "nl",
+    "English": "en",
+    "Esperanto": "eo",
+    "Estonian": "et",
+    "Filipino": "tl",
+    "Finnish": "fi",
+    "French": "fr",
+    "German": "de",
+    "Greek": "el",
+    "Gujarati": "gu",
+    "Hebrew": "iw",
+    "Hindi": "hi",
+    "Hungarian": "hu",
+    "Icelandic": "is",
+    "Indonesian": "id",
+    "Italian": "it",
+    "Japanese": "ja",
+    "Javanese": "jw",
+    "Kannada": "kn",
+    "Kazakh": "kk",
+    "Khmer": "km",
+    "Korean": "ko",
+    "Kurdish": "ku",
+    "Kyrgyz": "ky",
+    "Lao": "lo",
+    "Latin": "la",
+    "Latvian": "lv",
+    "Lithuanian": "lt",
+    "Macedonian": "mk",
+    "Malagasy": "mg",
+    "Malay": "ms",
+    "Malayalam": "ml",
+    "Maltese": "mt",
+    "Marathi": "mr",
+    "Mongolian": "mn",
+    "Nepali": "ne",
+    "Norwegian": "no",
+    "Persian": "fa",
+    "Polish": "pl",
+    "Portuguese": "pt",
+    "Punjabi": "pa",
+    "Romanian": "ro",
+    "Russian": "ru",
+    "Serbian": "sr",
+    "Sinhala": "si",
+    "Slovak": "sk",
+    "Slovenian": "sl",
+    "Spanish": "es",  # Corrected the language code for Spanish
+    "Swahili": "sw",
+    "Swedish": "sv",
+    "Tamil": "ta",
+    "Telugu": "te",
+    "Thai": "th",
+    "Turkish": "tr",
+    "Ukrainian": "uk",
+    "Urdu": "ur",
+    "Uzbek": "uz",
+    "Vietnamese": "vi",
+    "Welsh": "cy",
+    "Xhosa": "xh",
+    "Yiddish": "yi",
+    "Yoruba": "yo",
+    "Zulu": "zu",
+}
 
+def synthesize_audio(translated_text, target_language, translations="translations", simulate_male_voice=False):
     logger.info(f"translated_text: {translated_text}")
 
     # Make sure the translations directory exists
@@ -113,6 +120,34 @@ def synthesize_audio(translated_text, target_language, translations="translation
         return None
 
 TEXT_CHUNK = 4000
+# Regular expression pattern for matching punctuation marks in multiple languages
+PUNCTUATION_PATTERN = r'[\.,!?;:؛،।。]'
+# Where a streamed translation may be cut: punctuation followed by a space (so "3.5" stays whole), or a full-width stop
+STREAM_BOUNDARY = re.compile(PUNCTUATION_PATTERN + r'(?=\s)|。')
+# Characters a streamed piece collects before it is cut and sent to TTS, so commas do not make tiny requests
+STREAM_MIN_CHARS = int(os.environ.get("TTS_STREAM_MIN_CHARS", 80))
+# TTS requests of one streamed segment in flight at the same time
+STREAM_TTS_WORKERS = int(os.environ.get("TTS_STREAM_WORKERS", 3))
+# Chunks of one long text synthesized at the same time
+TTS_CHUNK_WORKERS = int(os.environ.get("TTS_CHUNK_WORKERS", 4))
+# Audio of every TTS request, in its own size bounded store so speech never evicts the other artifacts
+TTS_CACHE_FOLDER = os.environ.get("TTS_CACHE_FOLDER", "./tts_cache")
+TTS_CACHE_MAX_BYTES = int(os.environ.get("TTS_CACHE_MAX_BYTES", 2 * 1024 ** 3))
+
+tts_cache = ArtifactStore(TTS_CACHE_FOLDER, TTS_CACHE_MAX_BYTES)
+# Audio format asked from the TTS server: "flac" is lossless, so the speech is only encoded to a lossy
+# codec once at the final mux, and still compressed in the caches; "mp3" for servers without FLAC output
+TTS_FORMAT = os.environ.get("TTS_FORMAT", "flac")
+AUDIO_EXTENSION = f".{TTS_FORMAT}"
+# Codec and bitrate the chunks of one text are joined with, per TTS_FORMAT
+CHUNK_JOIN_CODECS = {
+    "flac": ("flac", None),
+    "wav": ("pcm_s16le", None),
+    "mp3": ("libmp3lame", "128k"),
+    "opus": ("libopus", "64k"),
+}
+# Bytes read from a streamed TTS response at a time, the most audio one call holds in memory
+SPEECH_STREAM_CHUNK = int(os.environ.get("TTS_STREAM_READ_BYTES", 64 * 1024))
 
 def split_text_into_chunks(text):
     """
@@ -120,13 +155,10 @@ def split_text_into_chunks(text):
     """
     chunks = []
     current_chunk = ""
-    # Regular expression pattern for matching punctuation marks in multiple languages
-
-    punctuation_pattern = r'[\.,!?;:؛،।。]'
 
     # Find all matches of the punctuation pattern in the text
     # Split text into sentences based on punctuation marks
-    sentences = re.split(punctuation_pattern, text)
+    sentences = re.split(PUNCTUATION_PATTERN, text)
     for sentence in sentences:
         if len(current_chunk) + len(sentence) + 2 <= TEXT_CHUNK:  # Add 2 for the '. ' separator
             # Add sentence to current chunk
@@ -139,74 +171,199 @@ def split_text_into_chunks(text):
         chunks.append(current_chunk)
     return chunks
 
+def split_text_stream(deltas, min_chars=STREAM_MIN_CHARS):
+    """
+    Yield the text arriving in deltas as pieces cut at the last punctuation boundary,
+    as soon as at least min_chars are buffered; the rest is yielded when the stream ends.
+    """
+    buffer = ""
+    for delta in deltas:
+        buffer += delta
+        if len(buffer) < min_chars:
+            continue
+        boundaries = list(STREAM_BOUNDARY.finditer(buffer))
+        if boundaries:
+            cut = boundaries[-1].end()
+            piece, buffer = buffer[:cut].strip(), buffer[cut:]
+            if piece:
+                yield piece
+    if buffer.strip():
+        yield buffer.strip()
+
 def insert_pause(chunk):
     """
     Replace occurrences of 'DYNAMIC MUSIC' with a pause of around 10 seconds.
     """
     return chunk.replace('DYNAMIC MUSIC', ' [PAUSE:10] ')
 
-
-
-def synthesize_audio_openai(translated_text, target_language, output_file_path=None, api_key=None, simulate_male_voice=True, speaker=0, speed = 1.1):
-    """
-    Synthesize audio for the translated text.
-    """
+def tts_voice(simulate_male_voice=True, speaker=0):
     male_voices = ["fable", "echo", "onyx"]
     female_voices = [ "alloy","nova" , "shimmer"] 
+    # Set voice parameter based on voice type
+    return male_voices[speaker % len(male_voices)] if simulate_male_voice else female_voices[speaker % 2]  # Male voice if simulate_male_voice is True, else female voice
 
+def tts_settings(api_key=None, simulate_male_voice=True, speaker=0, speed=None, voice=None):
+    """
+    Client, rate limiter provider, model, voice and speed used for a speaker.
+    speed defaults to the usual speed of the server and voice to the voice of the speaker when not given.
+    """
     local_url = os.environ.get("TTS_URL", None)
 
+    # Shared client per server, so segments reuse the open connections
+    if local_url is not None or api_key is None: 
+            client = openai_client("sk-111111111", base_url=f"http://{local_url}/v1")
+            provider = "local_tts"
+            default_speed = 1.0 if simulate_male_voice else 0.95
+    else:                    
+        client = openai_client(api_key)
+        provider = "openai_tts"
+        default_speed = 1.0
+    speed = default_speed if speed is None else speed
+
+    # Set model parameter based on the target language
+    model = 'tts-1-hd'  # Adjust the model based on your preference tts-1-hd
+    logger.info(f"simulate_male_voice: {simulate_male_voice} , speaker: {speaker}")
+    voice = voice or tts_voice(simulate_male_voice, speaker)
+    logger.info(f"voice: {voice}, speed: {speed}")
+    return client, provider, model, voice, speed
+
+def tts_output_path(target_language, output_file_path=None):
     if output_file_path is None:
-        audio_filename = os.path.join(translations_folder, f"translated_audio_{target_language}.mp3")
-    else:
-        # open as file with OS library
-        audio_filename = os.path.join(translations_folder,output_file_path)
+        return os.path.join(translations_folder, f"translated_audio_{target_language}{AUDIO_EXTENSION}")
+    # open as file with OS library
+    return os.path.join(translations_folder,output_file_path)
 
+def stream_speech(client, model, voice, speed, text, output_path):
+    """Write the audio of one TTS request to output_path as it arrives, through a temporary file."""
+    temp_path = f"{output_path}.part"
     try:
-        # Initialize the OpenAI client
-        if local_url is not None or api_key is None: 
-                client = OpenAI(
-            # This part is not needed if you set these environment variables before import openai
-            # export OPENAI_API_KEY=sk-11111111111
-            # export OPENAI_BASE_URL=http://localhost:8000/v1
-                            api_key = "sk-111111111",
-                            base_url = f"http://{local_url}/v1",
-                            )
-                            
-                speed = 1.0 if simulate_male_voice else 0.95
-        else:                    
-            client = OpenAI(api_key=api_key)
-            speed = 1.0
-
-        # Set model parameter based on the target language
-        model = 'tts-1-hd'  # Adjust the model based on your preference tts-1-hd        logger.info(f"simulate_male_voice: {simulate_male_voice} , speaker: {speaker}")
-        # Set voice parameter based on voice type
-        voice = male_voices[speaker % 4] if simulate_male_voice else female_voices[speaker % 2]  # Male voice if simulate_male_voice is True, else female voice
-        logger.info(f"voice: {voice}")
-       
-        # Split translated text into chunks
-        text_chunks = split_text_into_chunks(translated_text)
+        with client.audio.speech.with_streaming_response.create(model=model, voice=voice, input=insert_pause(text), speed=speed, response_format=TTS_FORMAT) as response:
+            with open(temp_path, "wb") as audio_file:
+                for data in response.iter_bytes(SPEECH_STREAM_CHUNK):
+                    audio_file.write(data)
+        os.replace(temp_path, output_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return output_path
+
+def speech_key(client, model, voice, speed, text):
+    """TTS cache key of one request: the normalized text, voice, model, speed and server."""
+    # split_text_into_chunks ends chunks with extra '. ' separators, they don't change the speech
+    normalized_text = re.sub(r'(\s*\.)+$', '.', normalize_sentence(text))
+    return tts_cache.key("speech", hash_text(normalized_text), voice=voice, model=model, speed=speed, base_url=str(client.base_url))
 
-        # Synthesize audio for each chunk and concatenate them
-        audio_chunks = []
-        for chunk in text_chunks:
-            chunk_with_pause = insert_pause(chunk)
+def speech(client, provider, api_key, model, voice, speed, text, output_path):
+    """
+    Audio of one TTS request written to output_path, within the rate limits of the provider.
+    The audio is cached by speech_key, in the TTS_FORMAT the server returned. This is the only
+    cache of speech: a whole text is made of its cached chunks.
+    """
+    key = speech_key(client, model, voice, speed, text)
+    if tts_cache.materialize(key, output_path, AUDIO_EXTENSION):
+        logger.debug(f"TTS cache hit: {key}")
+        return output_path
+    rate_limiter.call(provider, api_key, stream_speech, client, model, voice, speed, text, output_path)
+    tts_cache.put_file(key, output_path, AUDIO_EXTENSION)
+    return output_path
 
+def synthesize_chunks(text_chunks, client, provider, api_key, model, voice, speed, audio_filename, max_workers=TTS_CHUNK_WORKERS):
+    """Synthesize the text chunks concurrently into chunk files next to audio_filename, returned in text order."""
+    chunk_files = [chunk_path(audio_filename, index) for index in range(len(text_chunks))]
+    if len(text_chunks) == 1:
+        return [speech(client, provider, api_key, model, voice, speed, text_chunks[0], chunk_files[0])]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(text_chunks)), thread_name_prefix="tts") as executor:
+        return list(executor.map(lambda chunk, path: speech(client, provider, api_key, model, voice, speed, chunk, path), text_chunks, chunk_files))
 
-            response = client.audio.speech.create(model=model, voice=voice, input=chunk_with_pause)
-            audio_chunks.append(response.content)
+def chunk_path(audio_filename, index):
+    return f"{audio_filename}.{index}.chunk{AUDIO_EXTENSION}"
 
-        # Save the synthesized speech to an MP3 file
-        #audio_filename = os.path.join(translations, f"translated_audio_{target_language}.mp3")
-        with open(audio_filename, "wb") as audio_file:
-            for chunk in audio_chunks:
-                audio_file.write(chunk)
+def remove_chunk_files(audio_filename):
+    folder = os.path.dirname(audio_filename) or "."
+    prefix = os.path.basename(audio_filename) + "."
+    for name in os.listdir(folder):
+        if name.startswith(prefix) and (name.endswith(f".chunk{AUDIO_EXTENSION}") or name.endswith(f".chunk{AUDIO_EXTENSION}.part")):
+            os.remove(os.path.join(folder, name))
+
+def join_audio_chunks(audio_filename, chunk_files):
+    """
+    Join the chunk files in order into audio_filename. Each chunk is decoded and the result written once,
+    losslessly for FLAC and WAV, instead of gluing MP3 frames.
+    The output path may be a link into the TTS cache, so it is replaced rather than overwritten.
+    """
+    try:
+        temp_filename = f"{audio_filename}.part"
+        codec, bitrate = CHUNK_JOIN_CODECS.get(TTS_FORMAT, CHUNK_JOIN_CODECS["mp3"])
+        concat_audio_files(chunk_files, temp_filename, codec=codec, bitrate=bitrate, output_format=TTS_FORMAT)
+        os.replace(temp_filename, audio_filename)
+    finally:
+        remove_chunk_files(audio_filename)
+
+def synthesize_audio_openai(translated_text, target_language, output_file_path=None, api_key=None, simulate_male_voice=True, speaker=0, speed = None, voice = None):
+    """
+    Synthesize audio for the translated text.
+    speed is passed to the TTS server (e.g. chosen by duration_budget); None uses the default of the server.
+    Already spoken chunks come from the TTS cache, so a repeated text makes no TTS call.
+    """
+    audio_filename = tts_output_path(target_language, output_file_path)
+
+    try:
+        client, provider, model, voice, speed = tts_settings(api_key, simulate_male_voice, speaker, speed, voice)
+
+        # Split translated text into chunks
+        text_chunks = split_text_into_chunks(translated_text)
+
+        # Synthesize audio for the chunks concurrently, streamed to disk, and join them in order
+        try:
+            chunk_files = synthesize_chunks(text_chunks, client, provider, api_key, model, voice, speed, audio_filename)
+        except Exception:
+            remove_chunk_files(audio_filename)
+            raise
+
+        # Save the synthesized speech to one audio file
+        join_audio_chunks(audio_filename, chunk_files)
         logger.info(f"Audio file successfully created: {audio_filename}")
         return audio_filename
     except Exception as e:
         print(f"Error synthesizing audio: {e}")
         return None
 
+def cached_audio_openai(translated_text, api_key=None, simulate_male_voice=True, speaker=0, speed=None, voice=None):
+    """True when every chunk of the text is in the TTS cache, so synthesize_audio_openai would make no TTS call."""
+    client, _, model, voice, speed = tts_settings(api_key, simulate_male_voice, speaker, speed, voice)
+    return all(tts_cache.get_file(speech_key(client, model, voice, speed, chunk), AUDIO_EXTENSION) is not None
+               for chunk in split_text_into_chunks(translated_text))
+
+def synthesize_audio_openai_stream(deltas, target_language, output_file_path=None, api_key=None, simulate_male_voice=True, speaker=0):
+    """
+    Synthesize audio while the translation is still arriving.
+    deltas yields pieces of the translated text (e.g. translate_text_stream); every piece cut by
+    split_text_stream is sent to TTS right away and the audio is written in text order.
+    Returns (audio file or None on failure, translated text).
+    """
+    audio_filename = tts_output_path(target_language, output_file_path)
+    client, provider, model, voice, speed = tts_settings(api_key, simulate_male_voice, speaker)
+    pieces = []
+    futures = []
+    try:
+        with ThreadPoolExecutor(max_workers=STREAM_TTS_WORKERS, thread_name_prefix="tts-stream") as executor:
+            for piece in split_text_stream(deltas):
+                logger.debug(f"Streaming piece to TTS: {piece}")
+                pieces.append(piece)
+                futures.append(executor.submit(speech, client, provider, api_key, model, voice, speed, piece, chunk_path(audio_filename, len(futures))))
+            chunk_files = [future.result() for future in futures]
+    except Exception as e:
+        print(f"Error synthesizing streamed audio: {e}")
+        remove_chunk_files(audio_filename)
+        return None, " ".join(pieces)
+
+    translated_text = " ".join(pieces)
+    if not chunk_files:
+        return None, translated_text
+    join_audio_chunks(audio_filename, chunk_files)
+    logger.info(f"Streamed audio file successfully created: {audio_filename} ({len(chunk_files)} pieces)")
+    return audio_filename, translated_text
+
 if __name__ == "__main__":
     translated_text = "Welcome to today's episode where we're diving into the cutting edge world of AI with a focus on GPT-4 all. I'm your host Darya and in this brief introduction we'll explore what GPT-4 all is all about. "
     translations_dir = "./app/translations"
@@ -1,5 +1,12 @@
 import re
 
+try:
+    import tiktoken
+except ImportError:  # the word count estimate below is used instead
+    tiktoken = None
+
+_encodings = {}
+
 def count_tokens(text):
     # Define the regular expression pattern to match words
     pattern = r'\b\w+\b'
@@ -44,3 +51,18 @@ def read_approx_tokens(text, num_tokens):
     selected_text = ' '.join(result)
 
     return selected_text
+
+
+def count_model_tokens(text, model="gpt-3.5-turbo"):
+    """
+    Number of tokens the model sees for the text, with the tiktoken encoding of the model when
+    tiktoken is installed, otherwise estimated from the word count (about 4 tokens per 3 words).
+    """
+    if tiktoken is None:
+        return (4 * count_tokens(text) + 2) // 3 + len(re.findall(r'[^\w\s]', text))
+    if model not in _encodings:
+        try:
+            _encodings[model] = tiktoken.encoding_for_model(model)
+        except KeyError:
+            _encodings[model] = tiktoken.get_encoding("cl100k_base")
+    return len(_encodings[model].encode(text))
@@ -1,9 +1,11 @@
 import openai
-import whisper
 import logging
 
 import os
 
+from .model_registry import model_registry, WHISPER_MODEL
+from .artifact_store import artifact_store, hash_array, hash_file
+
 # Set up logging
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -42,40 +44,36 @@ def generate_srt(segments):
 
 
 
-def transcribe_audio(audio_path):
+def transcribe_audio(audio_path, audio=None):
+    """
+    Transcribe an audio file, or the float32 16 kHz samples in audio.
+    When samples are given, audio_path only names the .txt/.srt outputs and does not have to exist.
+    """
     # Convert to absolute path
     absolute_audio_path = os.path.abspath(audio_path)
     
-    if not os.path.exists(absolute_audio_path):
+    if audio is None and not os.path.exists(absolute_audio_path):
         logger.error(f"Audio file does not exist: {absolute_audio_path}")
         return None
 
     try:
-        # Check if a corresponding TXT file already exists
         text_filename = os.path.splitext(absolute_audio_path)[0] + ".txt"
-        if os.path.exists(text_filename):
-            # If the TXT file exists, return its content without transcribing
-            with open(text_filename, "r", encoding="utf-8") as text_file:
-                transcribed_text = text_file.read()
-            logger.info(f"Text already transcribed, loaded from: {text_filename}")
-            return transcribed_text
-        
-        # Check if a corresponding SRT file already exists
         srt_filename = os.path.splitext(absolute_audio_path)[0] + ".srt"
-        if os.path.exists(srt_filename):
-            # If the SRT file exists, return its content without transcribing
-            with open(srt_filename, "r", encoding="utf-8") as srt_file:
-                transcribed_text = srt_file.read()
-            logger.info(f"SRT file already exists, loaded from: {srt_filename}")
-            return transcribed_text
 
-        # Load the Whisper model
-        model = whisper.load_model("small",device='cuda')
+        # Check if exactly this audio was already transcribed with this model
+        audio_hash = hash_file(absolute_audio_path) if audio is None else hash_array(audio)
+        transcript_key = artifact_store.key("transcript", audio_hash, model=WHISPER_MODEL)
+        transcribed_text = artifact_store.get_text(transcript_key)
+        if transcribed_text is not None:
+            logger.info(f"Text already transcribed, loaded from the artifact store: {transcript_key}")
+            return transcribed_text
 
         logger.info(f"Transcribing audio file: {absolute_audio_path}")
 
-        # Transcribe the audio with automatic language detection
-        result = model.transcribe(absolute_audio_path, language=None)  # Enable automatic language detection
+        # Borrow the process-wide Whisper model instead of loading it for every file
+        with model_registry.lease("whisper") as model:
+            # Transcribe the audio with automatic language detection
+            result = model.transcribe(absolute_audio_path if audio is None else audio, language=None)  # Enable automatic language detection
 
         # Extracting the transcribed text
         transcribed_text = result["text"]
@@ -97,12 +95,58 @@ def transcribe_audio(audio_path):
             text_file.write(srt_content)    
 
         logger.info(f"Transcribed srt text saved to: {srt_filename}")
-        
+
+        artifact_store.put_text(transcript_key, transcribed_text)
         return transcribed_text
     except Exception as e:
         logger.error(f"Error transcribing audio: {e}")
         return None
 
+def transcribe_words(audio_path, audio=None):
+    """
+    Transcribe the whole audio file (or its float32 16 kHz samples) in one pass with word level timestamps.
+    Returns {"text", "language", "words": [{"start", "end", "word"}, ...]} or None on error.
+    """
+    absolute_audio_path = os.path.abspath(audio_path)
+
+    if audio is None and not os.path.exists(absolute_audio_path):
+        logger.error(f"Audio file does not exist: {absolute_audio_path}")
+        return None
+
+    try:
+        # Check if exactly this audio was already transcribed with this model
+        audio_hash = hash_file(absolute_audio_path) if audio is None else hash_array(audio)
+        words_key = artifact_store.key("words", audio_hash, model=WHISPER_MODEL)
+        transcription = artifact_store.get_json(words_key)
+        if transcription is not None:
+            logger.info(f"Words already transcribed, loaded from the artifact store: {words_key}")
+            return transcription
+
+        logger.info(f"Transcribing audio file with word timestamps: {absolute_audio_path}")
+
+        with model_registry.lease("whisper") as model:
+            # Language detection and padding happen once for the whole file
+            result = model.transcribe(absolute_audio_path if audio is None else audio, language=None, word_timestamps=True)
+
+        words = [
+            {"start": word["start"], "end": word["end"], "word": word["word"]}
+            for segment in result["segments"]
+            for word in segment.get("words", [])
+        ]
+        transcription = {"text": result["text"], "language": result.get("language"), "words": words}
+        artifact_store.put_json(words_key, transcription)
+
+        # Keep the same text and srt outputs as transcribe_audio
+        with open(os.path.splitext(absolute_audio_path)[0] + ".txt", "w", encoding="utf-8") as text_file:
+            text_file.write(result["text"])
+        with open(os.path.splitext(absolute_audio_path)[0] + ".srt", "w", encoding="utf-8") as srt_file:
+            srt_file.write(generate_srt(result["segments"]))
+
+        return transcription
+    except Exception as e:
+        logger.error(f"Error transcribing audio: {e}")
+        return None
+
 # Example usage
 if __name__ == "__main__":    
 
@@ -1,14 +1,19 @@
 # translate.py
 import os
+import json
 import time
-import requests
-from openai import OpenAI
-from mistralai.client import MistralClient
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from mistralai.models.chat_completion import ChatMessage
 
 
 import re
-from .tokenizer_limiter import sent_tokenize, count_tokens
+from .tokenizer_limiter import sent_tokenize, count_tokens, count_model_tokens
+from .artifact_store import artifact_store, hash_text
+from .translation_memory import translation_memory
+from .translator_router import translator_router, CircuitOpenError
+from .rate_limiter import rate_limiter
+from .http_clients import openai_client, mistral_client, http_session, request_timeout
 
 import logging
 logger = logging.getLogger(__name__)
@@ -17,6 +22,43 @@ logger.setLevel(logging.DEBUG) #Set log level if needed
 # Regular expression pattern
 pattern = r'The text is written in (\w+) and translates to (\w+):'
 
+# Portions of one text sent at the same time to a provider, unless the translator sets "max_concurrency"
+DEFAULT_CONCURRENCY = {
+    "openai_translate_text": int(os.environ.get("OPENAI_CONCURRENCY", 4)),
+    "mistralai_translate_text": int(os.environ.get("MISTRALAI_CONCURRENCY", 2)),
+    "translate_text_with_ollama": int(os.environ.get("OLLAMA_CONCURRENCY", 1)),
+}
+# Attempts of a single failed portion before the next translator is asked for it
+PORTION_RETRIES = int(os.environ.get("TRANSLATE_PORTION_RETRIES", 2))
+PORTION_RETRY_DELAY = float(os.environ.get("TRANSLATE_PORTION_RETRY_DELAY", 1.0))
+# Model tokens of segment texts packed into one request by translate_segments
+SEGMENT_BATCH_TOKENS = int(os.environ.get("SEGMENT_BATCH_TOKENS", 1500))
+
+# One semaphore per translation function, shared by every job in the process
+_provider_slots = {}
+_provider_slots_lock = threading.Lock()
+
+
+def ollama_request(ollama_url, payload, stream=False):
+    """
+    POST the payload to Ollama. HTTP errors are raised here, inside the rate limited call,
+    so a 429 or 5xx answer is backed off and retried like an exception of the other clients.
+    """
+    response = http_session(ollama_url).post(ollama_url, json=payload, timeout=request_timeout(), stream=stream)
+    try:
+        response.raise_for_status()
+    except Exception:
+        response.close()
+        raise
+    return response
+
+def ollama_lines(ollama_url, payload):
+    """Opens a streamed Ollama chat and returns the generator of its lines, which closes the response."""
+    response = ollama_request(ollama_url, payload, stream=True)
+    def lines():
+        with response:
+            yield from response.iter_lines()
+    return lines()
 
 def translate_text_with_ollama(source_text, target_language, api_key = None, prompt = None , model="mistral", emotions=None):
     """
@@ -51,7 +93,7 @@ def translate_text_with_ollama(source_text, target_language, api_key = None, pro
 
     try:
         start_time = time.time()
-        response = requests.post(ollama_url, json=payload)  # Make the request
+        response = rate_limiter.call("ollama", None, ollama_request, ollama_url, payload)  # Make the request
 
         elapsed_time = time.time() - start_time
 
@@ -79,11 +121,15 @@ def translate_text_with_ollama(source_text, target_language, api_key = None, pro
     
     return None 
 
+def request_tokens(translation_prompt):
+    """Rough token cost of a translation request: the prompt, and about as much again for the answer."""
+    return 2 * count_tokens(translation_prompt)
+
 def openai_translate_text(source_text, target_language, api_key, prompt=None, emotions=None):    
     logging(source_text, target_language, api_key, prompt=None)
     try:
-        # Initialize the OpenAI client with your organization and API key
-        client = OpenAI(api_key=api_key)
+        # Shared OpenAI client for this API key, its connections are kept alive between calls
+        client = openai_client(api_key)
 
         # Construct the translation prompt
         if prompt:            
@@ -95,8 +141,8 @@ def openai_translate_text(source_text, target_language, api_key, prompt=None, em
                 translation_prompt = f"Translate the following text from original language to [{target_language}]. Text to be translated:[{source_text}]"
 
 
-        # Make the API call using the client
-        response = client.chat.completions.create(
+        # Make the API call using the client, within the request and token budget of this key
+        response = rate_limiter.call("openai", api_key, client.chat.completions.create, tokens=request_tokens(translation_prompt),
             model="gpt-3.5-turbo",  # Specify the model you're using for translation
 
             messages=[
@@ -120,7 +166,7 @@ def mistralai_translate_text(source_text, target_language, api_key, prompt=None,
     logging(source_text, target_language, api_key, prompt=None)
     try:
         model = "mistral-large-latest"
-        client = MistralClient(api_key=api_key)
+        client = mistral_client(api_key)
         
         if prompt:
             translation_prompt = f"Translate the following text from original language to {target_language}] Textto betranslated: [{source_text} ,{prompt}"
@@ -132,11 +178,11 @@ def mistralai_translate_text(source_text, target_language, api_key, prompt=None,
 
 
         messages = [
-                ChatMessage(role="user", content=source_text)
+                ChatMessage(role="user", content=translation_prompt)
         ]
 
         # No streaming
-        chat_response = client.chat(
+        chat_response = rate_limiter.call("mistralai", api_key, client.chat, tokens=request_tokens(translation_prompt),
             model=model,
             messages=messages,
         ) 
@@ -149,63 +195,286 @@ def mistralai_translate_text(source_text, target_language, api_key, prompt=None,
         return None
 
 
+def stream_prompt(source_text, target_language, prompt=None):
+    if prompt:
+        return f"Translate the following text from original language to [{target_language}]. Reply only with the translation. Text to be translated: {source_text} {prompt}"
+    return f"Translate the following text from original language to [{target_language}]. Reply only with the translation. Text to be translated:[{source_text}]"
+
+def openai_translate_text_stream(source_text, target_language, api_key, prompt=None):
+    """Yields the OpenAI translation piece by piece as it is generated."""
+    client = openai_client(api_key)
+    translation_prompt = stream_prompt(source_text, target_language, prompt)
+    # The slot of the call is held until the stream is read
+    stream = rate_limiter.stream("openai", api_key, client.chat.completions.create, tokens=request_tokens(translation_prompt),
+        model="gpt-3.5-turbo",
+        messages=[
+            {"role": "system", "content": "You are  a highly intelligent translator."},
+            {"role": "user", "content": translation_prompt}
+        ],
+        temperature=0.9,
+        stream=True
+    )
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+def mistralai_translate_text_stream(source_text, target_language, api_key, prompt=None):
+    """Yields the MistralAI translation piece by piece as it is generated."""
+    client = mistral_client(api_key)
+    translation_prompt = stream_prompt(source_text, target_language, prompt)
+    stream = rate_limiter.stream("mistralai", api_key, client.chat_stream, tokens=request_tokens(translation_prompt),
+        model="mistral-large-latest",
+        messages=[ChatMessage(role="user", content=translation_prompt)],
+    )
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+def translate_text_with_ollama_stream(source_text, target_language, api_key=None, prompt=None, model="mistral"):
+    """Yields the Ollama translation piece by piece as it is generated."""
+    local_url = os.environ.get("OLLAMA_URL", "localhost:11434")
+    ollama_url = f"http://{local_url}/api/chat"
+    payload = {
+        "model": model,
+        "messages": [{"role": "user", "content": stream_prompt(source_text, target_language, prompt)}],
+        "stream": True
+    }
+    for line in rate_limiter.stream("ollama", None, ollama_lines, ollama_url, payload):
+        if not line:
+            continue
+        message = json.loads(line)
+        if message.get("message", {}).get("content"):
+            yield message["message"]["content"]
+        if message.get("done"):
+            break
+
 translators_func= {
     "openai_translate_text": openai_translate_text,
     "translate_text_with_ollama": translate_text_with_ollama,
     "mistralai_translate_text": mistralai_translate_text
 }
 
-def translate_api(text, target_language, api_key, translation_function, prompt=None, text_portions=230):
-    translated_text_parts = []
-    current_part_tokens = 0
-    current_part = []
-    source_sentences = sent_tokenize(text)
+# Streaming variants, by the name of the translation function in the translators dict
+translators_stream_func = {
+    "openai_translate_text": openai_translate_text_stream,
+    "translate_text_with_ollama": translate_text_with_ollama_stream,
+    "mistralai_translate_text": mistralai_translate_text_stream,
+}
 
-    for sentence in source_sentences:
-        current_part.append(sentence)
-        current_part_tokens += count_tokens(sentence)
+def provider_slots(function_name, limit):
+    with _provider_slots_lock:
+        if function_name not in _provider_slots:
+            _provider_slots[function_name] = threading.BoundedSemaphore(limit)
+        return _provider_slots[function_name]
 
-        if current_part_tokens > text_portions:
-            translated_part = translation_function(' '.join(current_part), target_language, api_key, prompt)
+def translate_portions(portions, target_language, api_key, translation_function, prompt=None, max_concurrency=2, slots=None,
+                       provider=None, hedge=None):
+    """
+    Translate the portions concurrently, keeping their order.
+    A failed portion is retried on its own; after PORTION_RETRIES it is left as None.
+    Calls go through the translator router, which records the latency of the provider and may hedge them.
+    """
+    slots = slots or threading.BoundedSemaphore(max_concurrency)
+    provider = provider or translation_function.__name__
+
+    def translate_portion(portion):
+        for attempt in range(PORTION_RETRIES + 1):
+            if attempt:
+                time.sleep(PORTION_RETRY_DELAY * 2 ** (attempt - 1))
+            with slots:
+                try:
+                    translated_part = translator_router.call(provider, translation_function, portion, target_language, api_key, prompt, hedge)
+                except CircuitOpenError as e:
+                    # Left for the next translator, retrying would only wait for the circuit
+                    logger.warning(f"Portion not translated: {e}")
+                    return None
+                except Exception as e:
+                    logger.error(f"Portion translation failed (attempt {attempt + 1}): {e}")
+                    translated_part = None
             if translated_part:
-                translated_text_parts.append(translated_part)
-            else:
-                return None
-
-            current_part = [sentence]
-            current_part_tokens = count_tokens(sentence)
+                return translated_part
+        return None
 
-    if current_part:
-        translated_part = translation_function(' '.join(current_part), target_language, api_key, prompt)
-        if translated_part:
-            translated_text_parts.append(translated_part)
+    if len(portions) == 1:
+        return [translate_portion(portions[0])]
+    with ThreadPoolExecutor(max_workers=min(max_concurrency, len(portions))) as executor:
+        return list(executor.map(translate_portion, portions))
 
-    translated_text = '\n'.join(translated_text_parts)
-    return translated_text
+def pack_sentences(sentences, text_portions=230):
+    """
+    Group consecutive sentences into portions of about text_portions tokens.
+    Returns lists of sentence indexes; a portion is sent as its sentences joined by new lines.
+    """
+    groups = []
+    current_group = []
+    current_group_tokens = 0
+    for index, sentence in sentences:
+        sentence_tokens = count_tokens(sentence)
+        if current_group and current_group_tokens + sentence_tokens > text_portions:
+            groups.append(current_group)
+            current_group = []
+            current_group_tokens = 0
+        current_group.append(index)
+        current_group_tokens += sentence_tokens
+    if current_group:
+        groups.append(current_group)
+    return groups
+
+def translate_sentences(sentences, translations, target_language, api_key, translation_function, prompt=None, text_portions=230,
+                        max_concurrency=2, slots=None, provider=None, model=None, hedge=None):
+    """
+    Fill the None entries of translations with the translations of the matching sentences.
+    Sentences already in the translation memory are not sent again, and every distinct sentence
+    is translated once per call. When a translated portion keeps one line per sentence the lines
+    are stored in the memory; otherwise its sentences are sent again one at a time, so a merged
+    answer is never copied to the other places of a repeated sentence.
+    """
+    provider = provider or translation_function.__name__
+    missing = [index for index, translation in enumerate(translations) if translation is None]
+    remembered = translation_memory.lookup([sentences[index] for index in missing], target_language, provider, model, prompt)
+
+    unique = {}
+    for index in missing:
+        if sentences[index] in remembered:
+            translations[index] = remembered[sentences[index]]
+        else:
+            unique.setdefault(sentences[index], []).append(index)
+    if not unique:
+        return translations
+
+    unique_sentences = list(unique)
+    groups = pack_sentences(enumerate(unique_sentences), text_portions)
+    results = translate_portions(['\n'.join(unique_sentences[index] for index in group) for group in groups],
+                                 target_language, api_key, translation_function, prompt, max_concurrency, slots, provider, hedge)
+
+    learned = []
+    misaligned = []
+    for group, result in zip(groups, results):
+        if result is None:
+            continue
+        lines = [line.strip() for line in result.splitlines() if line.strip()]
+        if len(group) == 1:
+            learned.append((unique_sentences[group[0]], result.strip()))
+        elif len(lines) == len(group):
+            learned.extend((unique_sentences[index], line) for index, line in zip(group, lines))
+        else:
+            logger.debug(f"Portion of {len(group)} sentences came back as {len(lines)} lines, sending them one at a time")
+            misaligned.extend(group)
 
-def translate_text(source_text, target_language, translators, prompt=None, audio_path=None):
-    translated_text = None
-    for translator_name, translator_info in translators.items():
-        translation_function = translator_info['function']
-        api_key = translator_info.get("api_key")
-        logger.debug(f"translation_function: {translation_function}")
-        translation_function  = translators_func[translation_function]
-        logger.debug(f"translators_func: {translation_function}")
-        
+    if misaligned:
+        results = translate_portions([unique_sentences[index] for index in misaligned],
+                                     target_language, api_key, translation_function, prompt, max_concurrency, slots, provider, hedge)
+        # A sentence that fails again stays None for the next translator
+        learned.extend((unique_sentences[index], result.strip()) for index, result in zip(misaligned, results) if result is not None)
 
-        try:
-            translated_text = translate_api(source_text, target_language, api_key, translation_function, prompt)
-        except Exception as e:
-            logger.critical(f"An error occurred while translating using {translator_info['name']}: {str(e)}.")
-            continue
+    for sentence, translation in learned:
+        for sentence_index in unique[sentence]:
+            translations[sentence_index] = translation
+    translation_memory.store(learned, target_language, provider, model, prompt)
+    return translations
 
-        if translated_text:
-            break
+def join_translations(translations):
+    return '\n'.join(translation for translation in translations if translation)
 
-    if not translated_text:
-        logger.error("All translation attempts failed.")
+def parse_batch_translation(response, target_languages, count):
+    """
+    Per language lists of count translated sentences from a batched response,
+    or None when the response is not the expected JSON object.
+    """
+    if not response:
         return None
+    match = re.search(r'\{.*\}', response, re.S)
+    if match is None:
+        return None
+    try:
+        data = json.loads(match.group(0))
+    except ValueError:
+        return None
+    if not isinstance(data, dict):
+        return None
+    data = {str(language).strip().lower(): lines for language, lines in data.items()}
+    parsed = {}
+    for language in target_languages:
+        lines = data.get(language.strip().lower())
+        if not isinstance(lines, list) or len(lines) != count or not all(isinstance(line, str) and line.strip() for line in lines):
+            return None
+        parsed[language] = [line.strip() for line in lines]
+    return parsed
+
+def translate_sentences_batch(sentences, translations, target_languages, api_key, translation_function, prompt=None, text_portions=230,
+                              max_concurrency=2, slots=None, provider=None, model=None, hedge=None):
+    """
+    Fill the None entries of translations[language] for several languages with one request per portion.
+    The portion is sent as a JSON array of sentences and a JSON object with one array per language is expected back.
+    Portions with a malformed response are left as None for the single language fallback.
+    """
+    provider = provider or translation_function.__name__
+    for language in target_languages:
+        missing = [index for index, translation in enumerate(translations[language]) if translation is None]
+        remembered = translation_memory.lookup([sentences[index] for index in missing], language, provider, model, prompt)
+        for index in missing:
+            if sentences[index] in remembered:
+                translations[language][index] = remembered[sentences[index]]
+
+    unique = {}
+    for index, sentence in enumerate(sentences):
+        if any(translations[language][index] is None for language in target_languages):
+            unique.setdefault(sentence, []).append(index)
+    if not unique:
+        return translations
+
+    unique_sentences = list(unique)
+    groups = pack_sentences(enumerate(unique_sentences), text_portions)
+    batch_prompt = (f"The text is a JSON array of sentences. Reply only with a JSON object whose keys are exactly {json.dumps(target_languages)} "
+                    f"and whose values are arrays with the translation of every sentence, in the same order.")
+    if prompt:
+        batch_prompt += f" {prompt}"
+    results = translate_portions([json.dumps([unique_sentences[index] for index in group], ensure_ascii=False) for group in groups],
+                                 ", ".join(target_languages), api_key, translation_function, batch_prompt, max_concurrency, slots, provider, hedge)
+
+    for group, result in zip(groups, results):
+        parsed = parse_batch_translation(result, target_languages, len(group))
+        if parsed is None:
+            logger.warning(f"Batched translation of {len(group)} sentences to {target_languages} could not be parsed, falling back to one language per call")
+            continue
+        for language, lines in parsed.items():
+            for index, line in zip(group, lines):
+                for sentence_index in unique[unique_sentences[index]]:
+                    if translations[language][sentence_index] is None:
+                        translations[language][sentence_index] = line
+            translation_memory.store([(unique_sentences[index], line) for index, line in zip(group, lines)], language, provider, model, prompt)
+    return translations
+
+def translation_key(source_text, target_language, translators, prompt=None):
+    # The same text translated to the same language with the same prompt and translators is reused
+    return artifact_store.key("translation", hash_text(source_text), target_language=target_language, prompt=prompt,
+                              translators=[(info["function"], info.get("model_name")) for info in translators.values()])
+
+def translator_settings(translator_info, hedge_info=None):
+    """
+    Translation function and the keyword arguments translate_sentences needs for this translator.
+    hedge_info is the translator asked as well when this one is slow.
+    """
+    function_name = translator_info['function']
+    logger.debug(f"translation_function: {function_name}")
+    translation_function  = translators_func[function_name]
+    logger.debug(f"translators_func: {translation_function}")
+    max_concurrency = translator_info.get("max_concurrency", DEFAULT_CONCURRENCY.get(function_name, 2))
+    hedge = None
+    if hedge_info is not None:
+        hedge_function_name = hedge_info["function"]
+        # The hedge takes one of the slots of its own provider, like any other call to it
+        hedge_slots = provider_slots(hedge_function_name, hedge_info.get("max_concurrency", DEFAULT_CONCURRENCY.get(hedge_function_name, 2)))
+        hedge = (hedge_info.get("name", hedge_function_name), translators_func[hedge_function_name], hedge_info.get("api_key"), hedge_slots)
+    return translation_function, {
+        "max_concurrency": max_concurrency,
+        "slots": provider_slots(function_name, max_concurrency),
+        "provider": translator_info.get("name", function_name),
+        "model": translator_info.get("model_name"),
+        "hedge": hedge,
+    }
 
+def save_translation(translated_text, target_language, audio_path):
     # Save translated text to file if audio_path is provided
     if audio_path is not None:
         absolute_audio_path = os.path.abspath(audio_path)
@@ -214,9 +483,220 @@ def translate_text(source_text, target_language, translators, prompt=None, audio
             text_file.write(translated_text)
         logger.info(f"Translated text saved to file: {text_filename}")
 
+def translate_text(source_text, target_language, translators, prompt=None, audio_path=None):
+    key = translation_key(source_text, target_language, translators, prompt)
+    translated_text = artifact_store.get_text(key)
+    if translated_text is not None:
+        logger.info(f"Translation loaded from the artifact store: {key}")
+    else:
+        sentences = sent_tokenize(source_text)
+        translations = [None] * len(sentences)
+        # Fastest healthy provider first, the next one is its hedge
+        ordered = translator_router.order(translators)
+        for position, translator_info in enumerate(ordered):
+            translation_function, settings = translator_settings(translator_info, ordered[position + 1] if position + 1 < len(ordered) else None)
+            api_key = translator_info.get("api_key")
+
+            # Only the sentences the previous translators failed on
+            try:
+                translate_sentences(sentences, translations, target_language, api_key, translation_function, prompt, **settings)
+            except Exception as e:
+                logger.critical(f"An error occurred while translating using {translator_info['name']}: {str(e)}.")
+                continue
+
+            if None not in translations:
+                translated_text = join_translations(translations)
+                artifact_store.put_text(key, translated_text)
+                break
+
+    if not translated_text:
+        logger.error("All translation attempts failed.")
+        return None
+
+    save_translation(translated_text, target_language, audio_path)
     logger.info(f"Translated: {translated_text}")
     return translated_text
 
+def translate_text_batch(source_text, target_languages, translators, prompt=None, audio_path=None):
+    """
+    Translate the text to every language of target_languages, asking each translator for all the
+    missing languages in one JSON request per portion and falling back to one call per language
+    for the portions it could not parse. Returns {language: translated text or None}.
+    """
+    if len(target_languages) == 1:
+        return {target_languages[0]: translate_text(source_text, target_languages[0], translators, prompt, audio_path)}
+
+    results = {}
+    for language in target_languages:
+        results[language] = artifact_store.get_text(translation_key(source_text, language, translators, prompt))
+    pending = [language for language in target_languages if results[language] is None]
+
+    sentences = sent_tokenize(source_text)
+    translations = {language: [None] * len(sentences) for language in pending}
+    ordered = translator_router.order(translators)
+    for position, translator_info in enumerate(ordered):
+        if not pending:
+            break
+        translation_function, settings = translator_settings(translator_info, ordered[position + 1] if position + 1 < len(ordered) else None)
+        api_key = translator_info.get("api_key")
+        try:
+            if len(pending) > 1:
+                translate_sentences_batch(sentences, translations, pending, api_key, translation_function, prompt, **settings)
+            for language in pending:
+                if None in translations[language]:
+                    translate_sentences(sentences, translations[language], language, api_key, translation_function, prompt, **settings)
+        except Exception as e:
+            logger.critical(f"An error occurred while translating using {translator_info['name']}: {str(e)}.")
+            continue
+
+        for language in pending:
+            if None not in translations[language]:
+                results[language] = join_translations(translations[language])
+                artifact_store.put_text(translation_key(source_text, language, translators, prompt), results[language])
+        pending = [language for language in pending if results[language] is None]
+
+    for language, translated_text in results.items():
+        if translated_text:
+            save_translation(translated_text, language, audio_path)
+        else:
+            logger.error(f"All translation attempts to {language} failed.")
+    return results
+
+def translate_text_stream(source_text, target_language, translators, prompt=None):
+    """
+    Yields the translation of source_text in pieces as the translator generates it.
+    A translator that fails before its first piece is skipped for the next one; a failure after
+    the first piece is raised, since the caller already used the text. Without any streaming
+    translator the translate_text result is yielded at once.
+    """
+    key = translation_key(source_text, target_language, translators, prompt)
+    translated_text = artifact_store.get_text(key)
+    if translated_text is not None:
+        logger.info(f"Translation loaded from the artifact store: {key}")
+        yield translated_text
+        return
+
+    for translator_info in translator_router.order(translators):
+        stream_function = translators_stream_func.get(translator_info["function"])
+        if stream_function is None:
+            continue
+        provider = translator_info.get("name", translator_info["function"])
+        if not translator_router.admit(provider):
+            continue
+        stats = translator_router.stats_for(provider)
+        start_time = time.time()
+        parts = []
+        try:
+            for part in stream_function(source_text, target_language, translator_info.get("api_key"), prompt):
+                parts.append(part)
+                yield part
+        except GeneratorExit:
+            # The caller stopped reading, the call still ends a half-open trial
+            stats.record(time.time() - start_time, bool(parts))
+            raise
+        except Exception as e:
+            stats.record(time.time() - start_time, False)
+            if parts:
+                raise
+            logger.error(f"Streaming translation with {translator_info['name']} failed: {e}")
+            continue
+        stats.record(time.time() - start_time, bool(parts))
+        if parts:
+            artifact_store.put_text(key, "".join(parts))
+            return
+
+    translated_text = translate_text(source_text, target_language, translators, prompt)
+    if translated_text:
+        yield translated_text
+
+def pack_segments(indexes, texts, budget=SEGMENT_BATCH_TOKENS):
+    """Group the segment indexes into batches whose texts (and ids) fit in budget model tokens."""
+    batches = []
+    current_batch = []
+    current_batch_tokens = 0
+    for index in indexes:
+        # The text, its id and the JSON punctuation around them
+        segment_tokens = count_model_tokens(texts[index]) + 6
+        if current_batch and current_batch_tokens + segment_tokens > budget:
+            batches.append(current_batch)
+            current_batch = []
+            current_batch_tokens = 0
+        current_batch.append(index)
+        current_batch_tokens += segment_tokens
+    if current_batch:
+        batches.append(current_batch)
+    return batches
+
+def parse_segment_batch(response, ids):
+    """{id: translation} when the response is a JSON object with exactly the ids, each with a non-empty text; else None."""
+    if not response:
+        return None
+    match = re.search(r'\{.*\}', response, re.S)
+    if match is None:
+        return None
+    try:
+        data = json.loads(match.group(0))
+    except ValueError:
+        return None
+    if not isinstance(data, dict):
+        return None
+    data = {str(key).strip(): value for key, value in data.items()}
+    if set(data) != set(ids) or not all(isinstance(value, str) and value.strip() for value in data.values()):
+        logger.warning(f"Segment batch answered {len(data)} of {len(ids)} segments")
+        return None
+    return {key: value.strip() for key, value in data.items()}
+
+def translate_segments(texts, target_language, translators, prompt=None, budget=SEGMENT_BATCH_TOKENS):
+    """
+    Translate many short texts (the speaker turns of a video) with few requests.
+    The texts are packed into batches of about budget model tokens, sent as a JSON object keyed by the
+    index of the text, and the answer must have exactly the same keys. A malformed answer is retried
+    as two smaller batches, a failed batch goes to the next translator, and whatever is left is
+    translated one text at a time with translate_text.
+    Returns the translations in the order of texts (None for empty texts or failures).
+    """
+    results = [None] * len(texts)
+    for index, text in enumerate(texts):
+        if text:
+            results[index] = artifact_store.get_text(translation_key(text, target_language, translators, prompt))
+    pending = [index for index, text in enumerate(texts) if text and results[index] is None]
+    batches = pack_segments(pending, texts, budget)
+    batch_prompt = ("The text is a JSON object mapping segment ids to the consecutive speaker turns of a video. "
+                    "Reply only with a JSON object with exactly the same ids, each mapped to the translation of its segment.")
+    if prompt:
+        batch_prompt += f" {prompt}"
+
+    ordered = translator_router.order(translators)
+    for position, translator_info in enumerate(ordered):
+        if not batches:
+            break
+        translation_function, settings = translator_settings(translator_info, ordered[position + 1] if position + 1 < len(ordered) else None)
+        api_key = translator_info.get("api_key")
+        failed = []
+        while batches:
+            logger.info(f"Translating {sum(len(batch) for batch in batches)} segments in {len(batches)} requests with {settings['provider']}")
+            responses = translate_portions([json.dumps({str(index): texts[index] for index in batch}, ensure_ascii=False) for batch in batches],
+                                           target_language, api_key, translation_function, batch_prompt,
+                                           settings["max_concurrency"], settings["slots"], settings["provider"], settings["hedge"])
+            retry = []
+            for batch, response in zip(batches, responses):
+                parsed = parse_segment_batch(response, [str(index) for index in batch])
+                if parsed is not None:
+                    for index in batch:
+                        results[index] = parsed[str(index)]
+                        artifact_store.put_text(translation_key(texts[index], target_language, translators, prompt), results[index])
+                elif response is not None and len(batch) > 1:
+                    retry += [batch[:len(batch) // 2], batch[len(batch) // 2:]]
+                else:
+                    failed.append(batch)
+            batches = retry
+        batches = failed
+
+    for batch in batches:
+        for index in batch:
+            results[index] = translate_text(texts[index], target_language, translators, prompt)
+    return results
+
 def logging(source_text, target_language, api_key, prompt=None):
     logger.info(f"[Function]: {__name__}: Starting call with these inputs:")
     logger.info(f"source_text: [{source_text}]")
@@ -0,0 +1,101 @@
+# translation_memory.py
+import os
+import re
+import time
+import sqlite3
+import threading
+import unicodedata
+
+import logging
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)  # Set log level if needed
+
+TRANSLATION_MEMORY_PATH = os.environ.get("TRANSLATION_MEMORY_PATH", "./translation_memory/memory.sqlite3")
+
+
+def normalize_sentence(sentence):
+    """Unicode normalized, whitespace collapsed form of the sentence, used as the lookup key."""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", sentence)).strip()
+
+
+class TranslationMemory():
+    """
+    Sentence level translations keyed by normalized source sentence, target language,
+    provider, model and prompt, shared by all jobs through a SQLite file.
+    """
+    def __init__(self, path=TRANSLATION_MEMORY_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = None
+        self.hits = 0
+        self.misses = 0
+
+    def _connect(self):
+        if self.connection is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self.connection = sqlite3.connect(self.path, check_same_thread=False)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS translations (
+                    source TEXT NOT NULL,
+                    target_language TEXT NOT NULL,
+                    provider TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    prompt TEXT NOT NULL,
+                    translation TEXT NOT NULL,
+                    hits INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (source, target_language, provider, model, prompt)
+                )""")
+        return self.connection
+
+    def lookup(self, sentences, target_language, provider, model=None, prompt=None):
+        """Returns {sentence: translation} for the sentences found in the memory."""
+        keys = {sentence: normalize_sentence(sentence) for sentence in sentences}
+        found = {}
+        with self.lock:
+            connection = self._connect()
+            for key in set(keys.values()):
+                row = connection.execute(
+                    "SELECT translation FROM translations WHERE source=? AND target_language=? AND provider=? AND model=? AND prompt=?",
+                    (key, target_language, provider, model or "", prompt or "")).fetchone()
+                if row is not None:
+                    found[key] = row[0]
+            if found:
+                connection.executemany(
+                    "UPDATE translations SET hits=hits+1 WHERE source=? AND target_language=? AND provider=? AND model=? AND prompt=?",
+                    [(key, target_language, provider, model or "", prompt or "") for key in found])
+                connection.commit()
+            hits = sum(1 for sentence in sentences if keys[sentence] in found)
+            self.hits += hits
+            self.misses += len(sentences) - hits
+        logger.info(f"Translation memory: {hits} hits, {len(sentences) - hits} misses ({provider}, {target_language})")
+        return {sentence: found[keys[sentence]] for sentence in sentences if keys[sentence] in found}
+
+    def store(self, pairs, target_language, provider, model=None, prompt=None):
+        """Saves (source sentence, translation) pairs."""
+        rows = [(normalize_sentence(source), target_language, provider, model or "", prompt or "", translation, time.time())
+                for source, translation in pairs if normalize_sentence(source) and translation.strip()]
+        if not rows:
+            return
+        with self.lock:
+            connection = self._connect()
+            connection.executemany(
+                "INSERT OR REPLACE INTO translations (source, target_language, provider, model, prompt, translation, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows)
+            connection.commit()
+
+    def stats(self):
+        with self.lock:
+            entries = self._connect().execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+        requests = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / requests if requests else 0.0,
+            "entries": entries,
+        }
+
+
+translation_memory = TranslationMemory()
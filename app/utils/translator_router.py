@@ -0,0 +1,231 @@
+# translator_router.py
+import os
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import logging
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)  # Set log level if needed
+
+# Calls per provider the latency and error statistics are computed on
+ROUTER_WINDOW = int(os.environ.get("ROUTER_WINDOW", 50))
+# Successful calls needed before a provider is ranked by latency and hedged after its p95
+ROUTER_MIN_SAMPLES = int(os.environ.get("ROUTER_MIN_SAMPLES", 5))
+# Consecutive failures that open the circuit, and how long it stays open before one trial call
+CIRCUIT_FAILURES = int(os.environ.get("CIRCUIT_FAILURES", 5))
+CIRCUIT_OPEN_SECONDS = float(os.environ.get("CIRCUIT_OPEN_SECONDS", 60))
+# Send a second request to the next provider when the first one is slower than its p95
+TRANSLATE_HEDGE = os.environ.get("TRANSLATE_HEDGE", "false").lower() == "true"
+HEDGE_WORKERS = int(os.environ.get("HEDGE_WORKERS", 8))
+
+
+class CircuitOpenError(Exception):
+    """The circuit of the provider is open (or its half-open trial call is already running)."""
+
+
+class ProviderStats():
+    """Rolling latency and outcome window of one provider, with its circuit breaker."""
+    def __init__(self, name, window=ROUTER_WINDOW):
+        self.name = name
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        # True while the single trial call of a half-open circuit is running
+        self.trial = False
+        self.lock = threading.Lock()
+
+    def record(self, latency, ok):
+        with self.lock:
+            self.trial = False
+            self.outcomes.append(ok)
+            if ok:
+                self.latencies.append(latency)
+                self.consecutive_failures = 0
+                self.open_until = 0.0
+            else:
+                self.consecutive_failures += 1
+                if self.consecutive_failures >= CIRCUIT_FAILURES:
+                    # Opened again right away when the trial call after the pause fails too
+                    if not self.open_until:
+                        logger.warning(f"Circuit opened for {self.name} after {self.consecutive_failures} consecutive failures")
+                    self.open_until = time.time() + CIRCUIT_OPEN_SECONDS
+
+    @property
+    def available(self):
+        """False while the circuit is open; once the pause is over it is half-open until the trial call is made."""
+        with self.lock:
+            return not self.open_until or (time.time() >= self.open_until and not self.trial)
+
+    def admit(self):
+        """
+        True when a call may be made: always with a closed circuit, and for exactly one caller
+        (the trial) once the pause of an open circuit is over.
+        """
+        with self.lock:
+            if not self.open_until:
+                return True
+            if time.time() < self.open_until or self.trial:
+                return False
+            self.trial = True
+            return True
+
+    def percentile(self, q):
+        with self.lock:
+            if len(self.latencies) < ROUTER_MIN_SAMPLES:
+                return None
+            latencies = sorted(self.latencies)
+        return latencies[round(q / 100 * (len(latencies) - 1))]
+
+    @property
+    def error_rate(self):
+        with self.lock:
+            return self.outcomes.count(False) / len(self.outcomes) if self.outcomes else 0.0
+
+    def expected_latency(self):
+        """Median latency divided by the success rate, None until there are enough samples."""
+        median = self.percentile(50)
+        if median is None:
+            return None
+        return median / max(1.0 - self.error_rate, 0.05)
+
+    def to_dict(self):
+        return {
+            "p50_seconds": self.percentile(50),
+            "p95_seconds": self.percentile(95),
+            "error_rate": self.error_rate,
+            "calls": len(self.outcomes),
+            "consecutive_failures": self.consecutive_failures,
+            "circuit_open": not self.available,
+        }
+
+
+class TranslatorRouter():
+    """
+    Orders the translators by their measured latency and error rate, skips the ones with an open
+    circuit, and optionally hedges a slow call with a second provider.
+    """
+    def __init__(self, hedge=TRANSLATE_HEDGE):
+        self.hedge = hedge
+        self.providers = {}
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix="hedge")
+
+    def stats_for(self, provider):
+        with self.lock:
+            if provider not in self.providers:
+                self.providers[provider] = ProviderStats(provider)
+            return self.providers[provider]
+
+    def order(self, translators):
+        """
+        Translator infos whose circuit is not open, the measured ones by expected latency, then the ones
+        without enough samples in their configured order. Providers with an open circuit are left out,
+        unless every provider's circuit is open.
+        """
+        def rank(item):
+            index, info = item
+            stats = self.stats_for(info.get("name", info["function"]))
+            expected = stats.expected_latency()
+            return (not stats.available, expected is None, expected or 0.0, index)
+        ranked = [info for _, info in sorted(enumerate(translators.values()), key=rank)]
+        available = [info for info in ranked if self.stats_for(info.get("name", info["function"])).available]
+        if not available and ranked:
+            logger.warning("The circuits of all translators are open, trying them anyway")
+            return ranked
+        return available
+
+    def admit(self, provider):
+        """
+        Whether a call to provider may be made now (see ProviderStats.admit). When the circuits of all
+        known providers are open the call is let through, there is nothing better to fall back to.
+        """
+        stats = self.stats_for(provider)
+        if stats.admit():
+            return True
+        with self.lock:
+            others = [other for other in self.providers.values() if other is not stats]
+        return not any(other.available for other in others)
+
+    def _timed(self, provider, function, *args):
+        start_time = time.time()
+        try:
+            result = function(*args)
+        except Exception:
+            self.stats_for(provider).record(time.time() - start_time, False)
+            raise
+        self.stats_for(provider).record(time.time() - start_time, bool(result))
+        return result
+
+    def _hedged(self, slots, provider, function, *args):
+        try:
+            return self._timed(provider, function, *args)
+        finally:
+            if slots is not None:
+                slots.release()
+
+    def call(self, provider, function, portion, target_language, api_key, prompt=None, hedge=None):
+        """
+        Call function(portion, target_language, api_key, prompt) in the calling thread and record its latency.
+        Raises CircuitOpenError when the circuit of the provider does not let the call through.
+        hedge is (provider, function, api_key, slots) of a second translator; when the call is still running
+        after the p95 latency of its provider the hedge is started on the hedge pool, if its circuit and its
+        provider slots allow it. The answer of the call is used when it has one, else the answer of the hedge.
+        """
+        if not self.admit(provider):
+            raise CircuitOpenError(f"Circuit of {provider} is open")
+        threshold = self.stats_for(provider).percentile(95) if self.hedge and hedge is not None else None
+        if threshold is None or not self.stats_for(hedge[0]).available:
+            return self._timed(provider, function, portion, target_language, api_key, prompt)
+
+        hedge_provider, hedge_function, hedge_api_key, hedge_slots = hedge
+        finished = threading.Event()
+        hedges = []
+
+        def start_hedge():
+            if finished.is_set() or (hedge_slots is not None and not hedge_slots.acquire(blocking=False)):
+                return
+            if not self.stats_for(hedge_provider).admit():
+                if hedge_slots is not None:
+                    hedge_slots.release()
+                return
+            logger.info(f"{provider} slower than its p95 ({threshold:.2f}s), hedging with {hedge_provider}")
+            hedges.append(self.executor.submit(self._hedged, hedge_slots, hedge_provider, hedge_function, portion, target_language, hedge_api_key, prompt))
+
+        # Measured from the start of the call itself, the hedge pool only runs the hedges
+        timer = threading.Timer(threshold, start_hedge)
+        timer.daemon = True
+        timer.start()
+        error = None
+        try:
+            result = self._timed(provider, function, portion, target_language, api_key, prompt)
+        except Exception as e:
+            error = e
+            result = None
+        finished.set()
+        timer.cancel()
+        if result:
+            return result
+
+        timer.join()
+        for future in hedges:
+            try:
+                hedge_result = future.result()
+            except Exception as e:
+                logger.error(f"Hedged call to {hedge_provider} failed: {e}")
+                continue
+            if hedge_result:
+                return hedge_result
+        if error is not None:
+            raise error
+        return result
+
+    def stats(self):
+        with self.lock:
+            providers = dict(self.providers)
+        return {name: stats.to_dict() for name, stats in providers.items()}
+
+
+translator_router = TranslatorRouter()
@@ -0,0 +1,234 @@
+# tts_backends.py
+import os
+import threading
+import multiprocessing
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from gtts import gTTS
+
+from .synthesize_audio import LANGUAGES, TTS_FORMAT, synthesize_audio_openai, cached_audio_openai, translations_folder, tts_cache
+from .artifact_store import hash_text
+from .translation_memory import normalize_sentence
+
+try:
+    import pyttsx3
+except ImportError:  # the local backend is only registered when pyttsx3 is installed
+    pyttsx3 = None
+
+import logging
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)  # Set log level if needed
+
+# Backend used by the pipeline: "openai" (OpenAI or the TTS_URL server), "gtts" or "local"
+TTS_BACKEND = os.environ.get("TTS_BACKEND", "openai")
+OPENAI_TTS_CONCURRENCY = int(os.environ.get("OPENAI_TTS_CONCURRENCY", 4))
+GTTS_CONCURRENCY = int(os.environ.get("GTTS_CONCURRENCY", 2))
+# Processes of the local backend; each one keeps its own speech engine
+LOCAL_TTS_WORKERS = int(os.environ.get("LOCAL_TTS_WORKERS", os.cpu_count() or 1))
+# Words per minute of the local engine
+LOCAL_TTS_RATE = int(os.environ.get("LOCAL_TTS_RATE", 170))
+
+
+class TTSBackend(ABC):
+    """
+    Speech synthesis backend. Subclasses implement _synthesize() and declare how many requests
+    may run at the same time, the audio formats they write (the first one is used), whether
+    they have a speed setting and whether synthesize() caches whole requests in tts_cache.
+    """
+    name = None
+    max_concurrency = 1
+    output_formats = ("mp3",)
+    supports_speed = False
+    cache_requests = True
+
+    def output_path(self, text, voice, lang, output_folder=None):
+        """File named after the request, so the same text, voice and language always land in the same file."""
+        key = hash_text(f"{self.name}\n{voice}\n{lang}\n{text}")[:24]
+        return os.path.join(output_folder or os.path.join(translations_folder, "tts"), f"{key}.{self.output_formats[0]}")
+
+    def _cache_key(self, text, voice, lang, speed):
+        return tts_cache.key("speech", hash_text(normalize_sentence(text)), backend=self.name, voice=voice, lang=lang, speed=speed)
+
+    def cached(self, text, voice, lang, speed=None, api_key=None):
+        """True when synthesize() would take the speech from the TTS cache instead of synthesizing it."""
+        speed = speed if self.supports_speed else None
+        return tts_cache.get_file(self._cache_key(text, voice, lang, speed), f".{self.output_formats[0]}") is not None
+
+    @abstractmethod
+    def _synthesize(self, text, voice, lang, output_path, speed=None, api_key=None):
+        """Writes the speech of text to output_path, returns output_path or None on failure."""
+
+    def synthesize(self, text, voice, lang, output_path, speed=None, api_key=None):
+        """
+        Speech of text written to output_path through the TTS cache, returns output_path or None on failure.
+        speed is ignored by backends without a speed setting, api_key by the ones without accounts.
+        """
+        speed = speed if self.supports_speed else None
+        if not self.cache_requests:
+            return self._synthesize(text, voice, lang, output_path, speed, api_key)
+        key = self._cache_key(text, voice, lang, speed)
+        suffix = f".{self.output_formats[0]}"
+        if tts_cache.materialize(key, output_path, suffix):
+            logger.debug(f"TTS cache hit: {key}")
+            return output_path
+        path = self._synthesize(text, voice, lang, output_path, speed, api_key)
+        if path is not None:
+            tts_cache.put_file(key, path, suffix)
+        return path
+
+    def synthesize_many(self, items, output_paths=None, output_folder=None, api_key=None):
+        """
+        Synthesizes (text, voice, lang) or (text, voice, lang, speed) items with up to max_concurrency
+        requests at a time, into output_paths or files named after the requests in output_folder.
+        Returns the output paths in the order of items (None for failures).
+        """
+        items = [tuple(item) + (None,) * (4 - len(item)) for item in items]
+        paths = output_paths or [self.output_path(text, voice, lang, output_folder) for text, voice, lang, _ in items]
+        for folder in {os.path.dirname(os.path.abspath(path)) for path in paths}:
+            os.makedirs(folder, exist_ok=True)
+
+        def synthesize(item, path):
+            text, voice, lang, speed = item
+            try:
+                return self.synthesize(text, voice, lang, path, speed, api_key)
+            except Exception as e:
+                logger.error(f"Error synthesizing audio with {self.name}: {e}")
+                return None
+
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_concurrency, len(items))), thread_name_prefix=f"tts-{self.name}") as executor:
+            return list(executor.map(synthesize, items, paths))
+
+    def describe(self):
+        return {"max_concurrency": self.max_concurrency, "output_formats": list(self.output_formats), "supports_speed": self.supports_speed}
+
+
+class OpenAITTSBackend(TTSBackend):
+    """OpenAI speech API, or the OpenAI compatible server at TTS_URL."""
+    name = "openai"
+    # The format the server is asked for
+    output_formats = (TTS_FORMAT,)
+    supports_speed = True
+    # speech() caches the chunks of the text, a whole request is not stored a second time
+    cache_requests = False
+
+    def __init__(self, max_concurrency=OPENAI_TTS_CONCURRENCY):
+        self.max_concurrency = max_concurrency
+
+    def _synthesize(self, text, voice, lang, output_path, speed=None, api_key=None):
+        """Without an api_key the TTS_URL server is used."""
+        return synthesize_audio_openai(text, lang, output_file_path=output_path, api_key=api_key, speed=speed, voice=voice)
+
+    def cached(self, text, voice, lang, speed=None, api_key=None):
+        return cached_audio_openai(text, api_key=api_key, speed=speed, voice=voice)
+
+
+class GTTSBackend(TTSBackend):
+    """Google Translate TTS; one voice per language, the voice argument is ignored."""
+    name = "gtts"
+    output_formats = ("mp3",)
+
+    def __init__(self, max_concurrency=GTTS_CONCURRENCY):
+        self.max_concurrency = max_concurrency
+
+    def _synthesize(self, text, voice, lang, output_path, speed=None, api_key=None):
+        try:
+            temp_path = f"{output_path}.part"
+            gTTS(text=text, lang=LANGUAGES.get(lang, lang)).save(temp_path)
+            os.replace(temp_path, output_path)
+            return output_path
+        except Exception as e:
+            logger.error(f"Error synthesizing audio with gTTS: {e}")
+            return None
+
+
+_engine = None
+
+def _local_synthesize(text, voice, lang, output_path, rate):
+    """Runs in a worker process of LocalTTSBackend, which keeps its pyttsx3 engine between calls."""
+    global _engine
+    if _engine is None:
+        _engine = pyttsx3.init()
+    _engine.setProperty("rate", rate)
+    voices = _engine.getProperty("voices")
+    code = LANGUAGES.get(lang, lang).lower()
+    # The voice itself when installed, else the first voice of the language
+    selected = next((installed for installed in voices if voice and voice in (installed.id, installed.name)), None) \
+        or next((installed for installed in voices
+                 if any(code in str(language).lower() for language in (installed.languages or [])) or code in installed.id.lower()), None)
+    if selected is not None:
+        _engine.setProperty("voice", selected.id)
+    temp_path = f"{output_path}.part.wav"
+    _engine.save_to_file(text, temp_path)
+    _engine.runAndWait()
+    os.replace(temp_path, output_path)
+    return output_path
+
+
+class LocalTTSBackend(TTSBackend):
+    """
+    Offline speech with the pyttsx3 engines of the system (eSpeak, SAPI5, NSSpeechSynthesizer),
+    in a process pool since the engines are neither thread safe nor release the GIL.
+    The workers are spawned, not forked: the pool is created from a pipeline thread of a process
+    with torch loaded and many threads running.
+    """
+    name = "local"
+    output_formats = ("wav",)
+
+    def __init__(self, workers=LOCAL_TTS_WORKERS, rate=LOCAL_TTS_RATE):
+        self.max_concurrency = workers
+        self.rate = rate
+        self.executor = None
+        self.lock = threading.Lock()
+
+    def _executor(self):
+        with self.lock:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(max_workers=self.max_concurrency, mp_context=multiprocessing.get_context("spawn"))
+            return self.executor
+
+    def _synthesize(self, text, voice, lang, output_path, speed=None, api_key=None):
+        try:
+            return self._executor().submit(_local_synthesize, text, voice, lang, output_path, self.rate).result()
+        except Exception as e:
+            logger.error(f"Error synthesizing audio with the local engine: {e}")
+            return None
+
+    def shutdown(self):
+        with self.lock:
+            if self.executor is not None:
+                self.executor.shutdown(wait=False)
+                self.executor = None
+
+
+class TTSRegistry():
+    """Named TTS backends, the pipeline picks one with TTS_BACKEND."""
+    def __init__(self):
+        self.backends = {}
+
+    def register(self, backend):
+        self.backends[backend.name] = backend
+
+    def get(self, name=None):
+        name = name or TTS_BACKEND
+        if name not in self.backends:
+            raise KeyError(f"Unknown TTS backend: {name} (available: {list(self.backends)})")
+        return self.backends[name]
+
+    def synthesize_many(self, items, backend=None, output_paths=None, output_folder=None, api_key=None):
+        return self.get(backend).synthesize_many(items, output_paths, output_folder, api_key)
+
+    def describe(self):
+        return {name: backend.describe() for name, backend in self.backends.items()}
+
+    def shutdown(self):
+        for backend in self.backends.values():
+            if hasattr(backend, "shutdown"):
+                backend.shutdown()
+
+
+tts_registry = TTSRegistry()
+tts_registry.register(OpenAITTSBackend())
+tts_registry.register(GTTSBackend())
+if pyttsx3 is not None:
+    tts_registry.register(LocalTTSBackend())
@@ -0,0 +1,112 @@
+# workspace.py
+import os
+import json
+import uuid
+import fcntl
+import shutil
+import threading
+
+import logging
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)  # Set log level if needed
+
+# Get the path to the translations folder from the environment variable
+translations_folder = os.environ.get("TRANSLATIONS_FOLDER", "./translations")
+
+# Completion checkpoints of every segment, in pipeline order (the job itself records "diarized")
+SEGMENT_STAGES = ("transcribed", "translated", "synthesized", "muxed")
+
+
+class WorkspaceBusyError(Exception):
+    pass
+
+
+class JobWorkspace():
+    """
+    Private scratch folder of one translation job.
+    The manifest lists the segments of the job, the files produced for them and the
+    stages already completed, so merging and cleanup never look at files of other jobs
+    and a retried job with the same job_id resumes from the first incomplete unit.
+    """
+    def __init__(self, job_id=None, root=translations_folder):
+        self.job_id = job_id or str(uuid.uuid4())
+        self.path = os.path.abspath(os.path.join(root, "jobs", self.job_id))
+        self.manifest_path = os.path.join(self.path, "manifest.json")
+        self.lock = threading.Lock()
+        self.lock_file = None
+        os.makedirs(self.path, exist_ok=True)
+        self.manifest = {"job_id": self.job_id, "stages": {}, "segments": []}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, "r", encoding="utf-8") as manifest_file:
+                self.manifest = json.load(manifest_file)
+            logger.info(f"Resuming job {self.job_id}, completed stages: {list(self.manifest['stages'])}, segments: {self.progress()}")
+
+    def acquire(self):
+        """Takes the workspace for this process, so the same job never runs twice at once."""
+        self.lock_file = open(os.path.join(self.path, ".lock"), "w")
+        try:
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self.lock_file.close()
+            self.lock_file = None
+            raise WorkspaceBusyError(f"Job {self.job_id} is already running.")
+
+    def release(self):
+        if self.lock_file is not None:
+            fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+            self.lock_file.close()
+            self.lock_file = None
+
+    @property
+    def segments(self):
+        return self.manifest["segments"]
+
+    def job_stage_done(self, stage):
+        return self.manifest["stages"].get(stage, False)
+
+    def mark_job_stage(self, stage):
+        with self.lock:
+            self.manifest["stages"][stage] = True
+        self.save()
+
+    @staticmethod
+    def segment_stage_done(segment, stage):
+        return segment.get("stages", {}).get(stage, False)
+
+    def mark_segment_stage(self, segment, stage):
+        with self.lock:
+            segment.setdefault("stages", {})[stage] = True
+        self.save()
+
+    def progress(self):
+        """Number of segments that completed each stage."""
+        return {stage: sum(1 for segment in self.segments if self.segment_stage_done(segment, stage)) for stage in SEGMENT_STAGES}
+
+    def file_path(self, filename):
+        return os.path.join(self.path, filename)
+
+    def set_segments(self, segments):
+        """Registers the segment dicts of the job; they are saved with every save()."""
+        with self.lock:
+            self.manifest["segments"] = segments
+        self.save()
+
+    def segment_files(self, key):
+        """Existing files stored under key in the segments, ordered by segment start time."""
+        with self.lock:
+            segments = sorted(self.manifest["segments"], key=lambda segment: segment["start"])
+        return [segment[key] for segment in segments if segment.get(key) and os.path.exists(segment[key])]
+
+    def save(self):
+        """Atomically writes the manifest."""
+        with self.lock:
+            temp_path = f"{self.manifest_path}.{threading.get_ident()}.part"
+            with open(temp_path, "w", encoding="utf-8") as manifest_file:
+                json.dump(self.manifest, manifest_file, ensure_ascii=False, indent=1)
+            os.replace(temp_path, self.manifest_path)
+
+    def cleanup(self):
+        """Removes the scratch folder of this job only."""
+        self.release()
+        shutil.rmtree(self.path, ignore_errors=True)
+        logger.info(f"Removed workspace {self.path}")